@@ -1,70 +1,92 @@
 from flaskr import create_app, db
 from flaskr.models import PanelInfo
-from flaskr import classes
-import difflib
+from flaskr import get_data
+from flaskr.name_index import NameIndex
+import flaskr.panel_search as ps
+import pandas as pd
 import pvlib
+import time
 
 def clear_moduledata():
     app = create_app()
     with app.app_context():
         panels = PanelInfo.query.all()
 
-        processed = []
-
-        for p in panels:
-            # Skip if too similar to already processed
-            if all(difflib.SequenceMatcher(None, p.panel_name, x).ratio() < 0.8 for x in processed):
-                # Create test cell to get conditions (or replace with pvlib inputs directly)
-                test_cell = classes.Solar_Cell(None, p.panel_name, 950, 25)
-                initial_conditions = test_cell.ACTUAL_CONDITIONS
-                print(f'Init conditions: {initial_conditions}')
-
-                # Extract params for pvlib singlediode:
-                # You will need to adapt these based on your data and initial_conditions structure
-                photocurrent = initial_conditions[0]  # example placeholder
-                saturation_current = initial_conditions[1]  # example placeholder
-                resistance_series = initial_conditions[3]  # example placeholder
-                resistance_shunt = initial_conditions[4]  # example placeholder
-                nNsVth = initial_conditions[3]*p.num_cells * ((298.15 *  1.380649e-23)/1.602176634e-19)  # example placeholder
-
-                # Run pvlib singlediode model
-                sd_result = pvlib.pvsystem.singlediode(
-                    photocurrent=photocurrent,
-                    saturation_current=saturation_current,
-                    resistance_series=resistance_series,
-                    resistance_shunt=resistance_shunt,
-                    nNsVth=nNsVth,
-                )
-
-                pmax = sd_result['p_mp']  # max power from pvlib model
-
-                # Update panel max_power field
-                p.max_power = pmax*p.num_cells
-                print(f"{p.panel_name} max power set to {pmax}")
-
-                processed.append(p.panel_name)
+        # Skip names too similar to one already kept, only near duplicates are compared
+        processed = NameIndex([p.panel_name for p in panels]).representatives(0.8)
+
+        # Calculate every kept panel's max power in one pass
+        max_powers = get_data.stc_max_power(get_data.module_params(processed)).to_dict()
+
+        mappings = [
+            {'id': p.id, 'max_power': max_powers[p.panel_name]}
+            for p in panels if p.panel_name in max_powers
+        ]
+        db.session.bulk_update_mappings(PanelInfo, mappings)
+        print(f"Set max power of {len(mappings)} panels")
 
         db.session.commit()
 
-def add_noct():
+'''
+@func fills panel_info columns from the CEC library in one pass, the library is joined
+    against panel_info by name and every changed row is written with one bulk update
+@params the panel_info columns (default all of get_data.panel_metadata) and whether to overwrite
+    values already set (default only fills the empty ones)
+@output the number of panels updated
+'''
+def backfill_metadata(columns=None, overwrite=False):
     app = create_app()
     with app.app_context():
-        cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
-        print(cec_modules.index) 
-
-        for name in cec_modules:
-            module = cec_modules[name]
+        start = time.perf_counter()
+        cec = pvlib.pvsystem.retrieve_sam('CECMod').T
+        library = get_data.panel_metadata(cec[~cec.index.duplicated(keep='first')])
+
+        columns = list(columns or library.columns)
+        unknown = [c for c in columns if c not in library.columns]
+        if unknown:
+            raise ValueError(f'No CEC source for {unknown}, choose from {list(library.columns)}')
+        library = library[columns]
+        loaded = time.perf_counter()
+
+        rows = PanelInfo.query.with_entities(
+            PanelInfo.id, PanelInfo.panel_name, *[getattr(PanelInfo, c) for c in columns]
+        ).all()
+        current = pd.DataFrame(rows, columns=['id', 'panel_name'] + columns)
+        current = current.drop_duplicates('panel_name').set_index('panel_name')
+        queried = time.perf_counter()
+
+        joined = current.join(library, how='inner', rsuffix='_cec')
+
+        mappings = {}
+        counts = {}
+        for c in columns:
+            new = joined[f'{c}_cec']
+            old = joined[c]
+            #missing from the library never clears a value
+            changed = new.notna() & (old.isna() if not overwrite else (old.isna() | (old != new)))
+            counts[c] = int(changed.sum())
+            for row_id, value in zip(joined['id'][changed], new[changed]):
+                value = int(value) if c in get_data._integer_metadata else float(value)
+                mappings.setdefault(int(row_id), {'id': int(row_id)})[c] = value
+        joined_at = time.perf_counter()
+
+        db.session.bulk_update_mappings(PanelInfo, list(mappings.values()))
+        db.session.commit()
+        written = time.perf_counter()
 
-            noct = module['T_NOCT']
+        #lengths, widths and cells are search filters
+        ps.invalidate_index()
 
-            record = PanelInfo.query.filter_by(
-                panel_name=name
-            ).first()
-            record.noct = noct
+        print(f'Matched {len(joined)} of {len(current)} panels to the CEC library, '
+            f'{len(current) - len(joined)} not in it')
+        for c in columns:
+            print(f'  {c}: {counts[c]} set')
+        print(f'Updated {len(mappings)} panels in {written - start:.2f}s (library {loaded - start:.2f}s, '
+            f'query {queried - loaded:.2f}s, join {joined_at - queried:.2f}s, write {written - joined_at:.2f}s)')
+        return len(mappings)
 
-            print(f'To {name} added noct: {noct}')
-        
-        db.session.commit()
+def add_noct():
+    return backfill_metadata(['noct'], overwrite=True)
 
 def clear_custom_and_panelinfo():
     from flaskr import create_app, db
@@ -41,12 +41,22 @@ def create_app(test_config=None):
     from . import cell_info
     app.register_blueprint(cell_info.ci)
 
+    #cell characteristics worked out in a request or job are saved once when its context ends,
+    #registered after the database so it runs before the session is removed
+    from .classes import Solar_Cell
+    app.teardown_appcontext(Solar_Cell.flush_cell_data)
+
     from . import panel_info
     app.register_blueprint(panel_info.pi)
 
     from . import string_modelling
     app.register_blueprint(string_modelling.sm)
 
+    #search index for /build_data so filtering never scans the table
+    #built in the background, the first search waits for it if needed
+    from . import panel_search
+    panel_search.warm_index(app)
+
     return app
 
 #clears the uploads folder when started
@@ -1,8 +1,7 @@
-from flask import Blueprint, render_template, request, session, url_for
+from flask import Blueprint, render_template, request, session, url_for, jsonify, Response
 from .classes import Solar_Cell
 import flaskr.helper_functions as hp
-import os
-from .models import PanelInfo
+import flaskr.refactored_helper as rh
 ci = Blueprint('cell_info', __name__)
 
 @ci.route('/generate_cell_graphs', methods=['GET', 'POST'])
@@ -13,32 +12,53 @@ def generate_cell_graphs():
         irr = float(request.form.get("irradiance", 950))
         panel_name = request.form.get("panel_name", "Jinko_Solar_Co___Ltd_JKM410M_72HL_V")
 
-        out_paths = []
-        plot_dir = f'flaskr/static/plots/{panel_name}'
-
         if request.method == 'POST':
             cell = Solar_Cell(initial_conditions=None, panel_name=panel_name,
                 shadow=irr, temp=temp)
-            Pmax, Vmp, Imp = [hp.round_sf(x, 3) for x in cell.model_power(True)]
+            Pmax, Vmp, Imp = [hp.round_sf(x, 3) for x in cell.model_power()]
             Voc, Isc = [hp.round_sf(x, 3) for x in cell.find_isc_voc()]
             Iph, Is, n, Rs, Rp, Kt = [hp.round_sf(x, 3) for x in cell.get_params()]
 
-        #finds path relative to panel name
-        if os.path.exists(plot_dir):
-            for fname in os.listdir(plot_dir):
-                if fname.endswith('.png'):
-                    out_paths.append(f'plots/{panel_name}/{fname}')
-
-        panels = PanelInfo.query.with_entities(PanelInfo.panel_name).distinct().all()
-        panel_names = [p.panel_name for p in panels]
-
-        return render_template('cell_page.html', graphs=out_paths,
+        #graphs are drawn in the browser from /cell_series
+        return render_template('cell_page.html', graphs=(request.method == 'POST'),
             temperature=temp, irradiance=irr, panel_name=panel_name,
             voc=Voc, isc=Isc, pmax=Pmax, vmp=Vmp, imp=Imp,
-            iph=Iph, isat=Is, n=n, rs=Rs, rp=Rp, panel_names=panel_names)
+            iph=Iph, isat=Is, n=n, rs=Rs, rp=Rp)
 
     except Exception as e:
         print(f'Failed due to {e}')
 
+#serves the iv/pv/pi series of a cell so the browser can chart them
+#format=binary returns float32 arrays (voltage, current, power) one after the other
+@ci.route('/cell_series', methods=['GET', 'POST'])
+def cell_series():
+    data = request.args if request.method == 'GET' else request.form
+    try:
+        temp = float(data.get("temperature", 25))
+        irr = float(data.get("irradiance", 950))
+        panel_name = data.get("panel_name", "Jinko_Solar_Co___Ltd_JKM410M_72HL_V")
+        points = int(data.get("points", 25))
+        fmt = data.get("format", "json")
+
+        cell = Solar_Cell(initial_conditions=None, panel_name=panel_name,
+            shadow=irr, temp=temp)
+        voltages, currents, powers = cell.iv_curve(points)
 
+        series = {
+            'voltage': [float(v) for v in voltages],
+            'current': [float(i) for i in currents],
+            'power': [float(p) for p in powers]
+        }
 
+        if fmt == 'binary':
+            body, names, length = rh._series_to_bytes(series)
+            return Response(body, mimetype='application/octet-stream', headers={
+                'X-Series-Names': ','.join(names),
+                'X-Series-Length': str(length)
+            })
+
+        return jsonify({"status": "success", "panel_name": panel_name, **series})
+
+    except Exception as e:
+        print(f'Failed due to {e}')
+        return jsonify({"status": "error", "message": str(e)})
@@ -1,26 +1,69 @@
 from .get_data import library_conditions, lib_mod_lookup
 import flaskr.helper_functions as hp
-import matplotlib.pyplot as plt
+import flaskr.param_grid as pg
 import math
 from functools import lru_cache
+from collections import Counter, OrderedDict
 import numpy as np
-from scipy.optimize import fsolve
 from flaskr.models import CellData, PanelInfo, ModuleData, CellLookup, ModuleLookup, WholeModuleLookup
 from flaskr import db
-from pvlib import pvsystem
+from flask import g, has_app_context
 
 
+#least recently used dictionary with a size cap, so the per condition memos can't grow forever
+#in a long running server, evicted entries are just worked out again
+class _BoundedCache(OrderedDict):
+    def __init__(self, maxsize):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        try:
+            self.move_to_end(key)
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        value = self.get(key)
+        if value is not None:
+            return value
+        self[key] = default
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+        return default
+
 #models the individual solar cells
 class Solar_Cell():
+    #cells only hold a reference to a shared parameter record so a whole string is cheap to build
+    __slots__ = ('panel_name', 'parent', '_record', 'volts', 'current', 'hash_db', 'isc_hash_db')
+
     #shard cache for all solar cells
     _cell_cache = None
 
+    #entries kept by each of the memos below
+    _cache_size = 8192
+
+    #interned (Iph, Is, n, Rs, Rp, T, G) records shared by every cell with the same (panel, G, T),
+    #records from given initial conditions are keyed by themselves
+    _records = _BoundedCache(_cache_size)
+
+    #open circuit voltage solved once per record
+    _voc = _BoundedCache(_cache_size)
+
+    #record -> memoised cell characteristics, None until worked out
+    _characteristic_fields = ('voc', 'isc', 'pmax', 'vmp', 'imp')
+    _characteristics = _BoundedCache(_cache_size)
+
+    #queued cell_data rows written early once this many are waiting
+    _flush_size = 200
+
     #constructor matching material of a cell to its ideal conditions
     def __init__(self, initial_conditions, panel_name, shadow, temp):
         try:
-            #an array containing conditions given 25 degrees and 950 irradiance
+            #a record containing conditions given 25 degrees and 950 irradiance
             self.panel_name = panel_name
-            self.ACTUAL_CONDITIONS = [0,0,0,0,0,0,0]
+            self._record = (0, 0, 0, 0, 0, 0, 0)
             self.parent = None
 
             #loads cache for first instance 
@@ -28,16 +71,29 @@ class Solar_Cell():
                 Solar_Cell._load_cell_cache()
 
             if initial_conditions is not None:
+                #keyed by the values so differing conditions never share a record
                 Iph, Is, n, Rs, Rp = initial_conditions
-                self.ACTUAL_CONDITIONS = [Iph, Is, n, Rs, Rp, 25, 950]
+                record = (Iph, Is, n, Rs, Rp, 25, 950)
+                self._record = Solar_Cell._records.setdefault(record, record)
             else:
-                self.ACTUAL_CONDITIONS[5] = temp
-                self.ACTUAL_CONDITIONS[6] = shadow
-                self.set_library_conditions()
+                self.set_library_conditions(shadow, temp)
 
         except Exception as e:
             print("Error constructing cell: ", e)
 
+    #read only view of the shared record, index 5 is temperature and 6 irradiance
+    @property
+    def ACTUAL_CONDITIONS(self):
+        return self._record
+
+    #swaps the record and flags the parent module if the conditions actually changed
+    def _set_record(self, record):
+        if record is not self._record:
+            self._record = record
+            if self.parent is not None:
+                self.parent._dirty = True
+                self.parent._open_voltage = None
+
     #loads the cache at the class level
     @classmethod
     def _load_cell_cache(cls):
@@ -64,9 +120,7 @@ class Solar_Cell():
     #takes an input of a shade level and returns the correct irradiance
     def set_shade(self, irr, temp):
         try:
-            self.ACTUAL_CONDITIONS[5] = temp
-            self.ACTUAL_CONDITIONS[6] = irr
-            self.set_library_conditions()
+            self.set_library_conditions(irr, temp)
         except Exception as e:
             print("Shading level incorrect: ", e)
 
@@ -74,7 +128,8 @@ class Solar_Cell():
     def set_temp(self, temp):
         try:
             if -15<=temp<=75:
-                self.ACTUAL_CONDITIONS[5] = temp
+                record = self._record
+                self._set_record(record[:5] + (temp, record[6]))
             else:
                 raise ValueError("Temp between -15 and 75 celcius")
         except ValueError as e:
@@ -83,6 +138,8 @@ class Solar_Cell():
     #with the input conditions and a voltage find current
     #this has to be solved via a numerical method
     def find_current(self, V):
+        from scipy.optimize import fsolve
+
         q = (1.6 * (10**-19))
         k = (1.38 * (10**-23))
 
@@ -97,6 +154,8 @@ class Solar_Cell():
     
     #same method for voltage
     def find_voltage(self, I):
+        from scipy.optimize import fsolve
+
         q = 1.6e-19
         k = 1.38e-23
 
@@ -117,51 +176,127 @@ class Solar_Cell():
     def find_short_circuit(self):
         return self.find_current(0)
     
-    #outputs Voc
+    #outputs Voc, only solved the first time a record is seen
     def find_open_voltage(self):
-        return self.find_voltage(0)
+        voc = Solar_Cell._voc.get(self._record)
+        if voc is None:
+            voc = Solar_Cell._voc.setdefault(self._record, self.find_voltage(0))
+        return voc
 
-    #finds both if not in db
+    #outputs Voc and Isc, worked out once per record and saved to cell_data
     def find_isc_voc(self):
-        T = self.ACTUAL_CONDITIONS[5]
-        G = self.ACTUAL_CONDITIONS[6]
-        record = CellData.query.filter_by(
-            panel_name = self.panel_name,
-            temperature = T,
-            irradiance = G
-        ).first() 
-
-        #if the record is found 
-        if record:
-            if record.voc is None:
-                voc = self.find_open_voltage()
-                record.voc = voc
-            else:
-                voc = record.voc
+        entry = self._characteristics_entry()
+
+        values = {}
+        if entry['voc'] is None:
+            values['voc'] = float(self.find_open_voltage())
+        if entry['isc'] is None:
+            values['isc'] = float(self.find_short_circuit())
+        if values:
+            self._remember(entry, **values)
+
+        return entry['voc'], entry['isc']
+
+    #db key of the current conditions, cell_data holds whole degrees/irradiances so others stay in memory
+    def _cell_data_key(self):
+        T = self._record[5]
+        G = self._record[6]
+        if float(T).is_integer() and float(G).is_integer():
+            return (self.panel_name, int(T), int(G))
+        return None
+
+    #the memo entry of the current record, filled from cell_data the first time the record is seen
+    def _characteristics_entry(self):
+        entry = Solar_Cell._characteristics.get(self._record)
+        if entry is not None:
+            return entry
+
+        entry = dict.fromkeys(Solar_Cell._characteristic_fields)
+        key = self._cell_data_key()
+        if key is not None:
+            row = CellData.query.filter_by(
+                panel_name = key[0],
+                temperature = key[1],
+                irradiance = key[2]
+            ).first()
 
-            if record.isc is None:
-                isc = self.find_short_circuit()
-                record.isc = isc
-            else:
-                isc = record.isc
+            #rows saved before the panel was refitted are left to be overwritten
+            params = None if row is None else (row.iph, row.isat, row.n, row.Rs, row.Rp)
+            if params is not None and None not in params and np.allclose(params, self._record[:5]):
+                entry.update({field: getattr(row, field) for field in Solar_Cell._characteristic_fields})
+
+        return Solar_Cell._characteristics.setdefault(self._record, entry)
+
+    #adds new values to the memo and queues the cell_data row on the app context,
+    #outside one there's no database so it's only kept in memory
+    def _remember(self, entry, **values):
+        entry.update(values)
+
+        key = self._cell_data_key()
+        if key is not None and has_app_context():
+            pending = g.setdefault('cell_data_pending', {})
+            Iph, Is, n, Rs, Rp = (float(x) for x in self._record[:5])
+            pending[key] = dict(entry, iph=Iph, isat=Is, n=n, Rs=Rs, Rp=Rp)
+            if len(pending) >= Solar_Cell._flush_size:
+                Solar_Cell.flush_cell_data()
+
+    #writes the rows queued on this app context in one commit
+    #registered with teardown_appcontext so every request/job saves its own rows when it ends
+    @classmethod
+    def flush_cell_data(cls, exc=None):
+        if not has_app_context():
+            return 0
+        pending = g.pop('cell_data_pending', None)
+        if not pending:
+            return 0
+
+        try:
+            existing = {
+                (row.panel_name, row.temperature, row.irradiance): row.id
+                for row in CellData.query.with_entities(
+                    CellData.id, CellData.panel_name, CellData.temperature, CellData.irradiance
+                ).filter(CellData.panel_name.in_({key[0] for key in pending}))
+            }
+
+            inserts = []
+            updates = []
+            for key, values in pending.items():
+                row_id = existing.get(key)
+                if row_id is None:
+                    inserts.append({'panel_name': key[0], 'temperature': key[1], 'irradiance': key[2], **values})
+                else:
+                    updates.append({'id': row_id, **values})
 
+            db.session.bulk_insert_mappings(CellData, inserts)
+            db.session.bulk_update_mappings(CellData, updates)
             db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f'Failed to save cell data due to {e}')
 
-            return voc, isc
-        
-        #if record not in the database need to calculate params and set
-        self.set_library_conditions()
-        return self.find_isc_voc()
+        return len(pending)
 
-    #uses the voltage to find the max power
-    #can set to true to output a graph
-    def model_power(self, draw_graph=False):
+    #sweeps voltage from 0 to voc to get the iv/pv curve
+    def iv_curve(self, points=25):
         voc = self.find_open_voltage()
         #creates a normal range of voltages to test
-        voltages = np.linspace(0, voc, 25) 
+        voltages = np.linspace(0, voc, points)
         currents = [self.find_current(V) for V in voltages]
         powers = [V*I for V, I in zip(voltages, currents)]
 
+        return voltages, currents, powers
+
+    #uses the voltage to find the max power, worked out once per record and saved to cell_data
+    #can set to true to output a graph
+    def model_power(self, draw_graph=False):
+        entry = self._characteristics_entry()
+        if entry['pmax'] is not None and not draw_graph:
+            self.volts = entry['vmp']
+            self.current = entry['imp']
+            return entry['pmax'], entry['vmp'], entry['imp']
+
+        voltages, currents, powers = self.iv_curve()
+
         power_index = np.argmax(powers)
         Pmax = powers[power_index]
         Vmp = voltages[power_index]
@@ -173,59 +308,45 @@ class Solar_Cell():
         self.volts = Vmp
         self.current = Imp
 
-        T = self.ACTUAL_CONDITIONS[5]
-        G = self.ACTUAL_CONDITIONS[6]
-
-        record = CellData.query.filter_by(
-            panel_name = self.panel_name,
-            temperature = T,
-            irradiance = G
-        ).first() 
-
-        if record:
-            if record.pmax is None:
-                record.pmax = Pmax
-                record.vmp = Vmp
-                record.imp = Imp
-
-            db.session.commit()
-
-            return Pmax, Vmp, Imp
-
-        else: 
-            self.set_library_conditions()
-            return self.model_power(draw_graph)
+        self._remember(entry, pmax=float(Pmax), vmp=float(Vmp), imp=float(Imp))
+        return Pmax, Vmp, Imp
 
     def get_params(self):
-        Iph = self.ACTUAL_CONDITIONS[0]
-        Is = self.ACTUAL_CONDITIONS[1]
-        n = self.ACTUAL_CONDITIONS[2]
-        Rs = self.ACTUAL_CONDITIONS[3]
-        Rp = self.ACTUAL_CONDITIONS[4]
-        Kt = self.ACTUAL_CONDITIONS[5] + 273.15
+        Iph, Is, n, Rs, Rp, T, G = self._record
+        Kt = T + 273.15
 
         return Iph, Is, n, Rs, Rp, Kt
     
-    def set_library_conditions(self):
+    #points the cell at the shared record for its conditions, defaults to the current ones
+    def set_library_conditions(self, G=None, T=None):
         try:
-            T = self.ACTUAL_CONDITIONS[5]
-            G = self.ACTUAL_CONDITIONS[6]
-            
-            #test if instance of tuple to look for cache hit
-            try:
-                values = self.find_hash_c(G, T)
-                #print("Found in db")
-                Iph, Is, n, Rs, Rp = values
-            except ValueError:
-                print("Not found checking library")
-                Iph, Is, n, Rs, Rp = library_conditions(self.panel_name, G, T)
-                self.save_hash_c(G, T, Iph, Is, n, Rs, Rp)
-
-            self.ACTUAL_CONDITIONS[0] = Iph
-            self.ACTUAL_CONDITIONS[1] = Is
-            self.ACTUAL_CONDITIONS[2] = n
-            self.ACTUAL_CONDITIONS[3] = Rs
-            self.ACTUAL_CONDITIONS[4] = Rp
+            if T is None:
+                T = self._record[5]
+            if G is None:
+                G = self._record[6]
+
+            #only the first cell with these conditions does the lookup
+            key = (self.panel_name, G, T)
+            record = Solar_Cell._records.get(key)
+            if record is None:
+                #the precomputed grid is exact enough to skip the rounded db cache
+                values = pg.module_params(self.panel_name, G, T)
+                if values is not None:
+                    Iph, Is, n, Rs, Rp = values
+                else:
+                    #test if instance of tuple to look for cache hit
+                    try:
+                        values = self.find_hash_c(G, T)
+                        #print("Found in db")
+                        Iph, Is, n, Rs, Rp = values
+                    except ValueError:
+                        print("Not found checking library")
+                        Iph, Is, n, Rs, Rp = library_conditions(self.panel_name, G, T)
+                        self.save_hash_c(G, T, Iph, Is, n, Rs, Rp)
+
+                record = Solar_Cell._records.setdefault(key, (Iph, Is, n, Rs, Rp, T, G))
+
+            self._set_record(record)
         except Exception as e:
             raise
 
@@ -284,6 +405,11 @@ class Simple_Module():
 
         self.Isc = 0
 
+        #set when a cell changes conditions so the totals are only recomputed when needed
+        self._dirty = True
+        self._total_params = None
+        self._open_voltage = None
+
         #each module has 1 bypass diode and a set number of rows of cells
         #every row should have the same ammount
         try: 
@@ -351,15 +477,22 @@ class Simple_Module():
         self.Isc = self.get_current(0)
         return self.Isc
 
-    #calculates total open voltage
+    #calculates total open voltage, one solve per distinct cell condition
     def module_open_voltage(self):
-        open_v = 0
-        for cell in self.cell_list:
-            open_v += cell.find_open_voltage()
-        return open_v
+        if self._open_voltage is None:
+            groups = Counter(cell._record for cell in self.cell_list)
+            cells = {cell._record: cell for cell in self.cell_list}
+            open_v = 0
+            for record, count in groups.items():
+                open_v += cells[record].find_open_voltage() * count
+            self._open_voltage = open_v
+        return self._open_voltage
     
     #gets voltage given current and average parameters
     def get_voltage(self, I, values=None):
+        from scipy.optimize import fsolve
+        from pvlib import pvsystem
+
         if values is None:
             Iph, Is, nC, Rs, Rp, Kt = self.get_total_params()
         else:
@@ -426,6 +559,8 @@ class Simple_Module():
 
     #current calculations
     def get_current(self, V):
+        from scipy.optimize import fsolve
+
         Iph, Is, nC, Rs, Rp, Kt = self.get_total_params()
 
         q = (1.6 * (10**-19))
@@ -443,6 +578,9 @@ class Simple_Module():
 
     #get average results for calculation
     def get_total_params(self):
+        if not self._dirty and self._total_params is not None:
+            return self._total_params
+
         self.update_cell_conditions()
         Iph = np.inf
         Is = nC = Rs = Rp = Kt = 0
@@ -461,7 +599,9 @@ class Simple_Module():
         nC = nC/self.cell_count
         Kt = Kt/self.cell_count
 
-        return Iph, Is, nC, Rs, Rp, Kt
+        self._total_params = (Iph, Is, nC, Rs, Rp, Kt)
+        self._dirty = False
+        return self._total_params
 
     #models power of the module
     def find_max_power(self, draw_graph=False):
@@ -471,8 +611,6 @@ class Simple_Module():
             self.update_cell_conditions()
 
             #get the maximum current that flows (short circuit current)
-            max_v = self.module_open_voltage()
-
             max_v = self.module_open_voltage()
             voltages = np.linspace(0, max_v, 25) 
             currents = [self.get_current(V) for V in voltages]
@@ -540,7 +678,10 @@ class Simple_Module():
     def activate_bypass(self):
         self.bypass_diode.activate()
         
+    #cells only need refreshing after one of them changed conditions
     def update_cell_conditions(self):
+        if not self._dirty:
+            return
         for i, cell in enumerate(self.cell_list):
             cell.set_library_conditions()
 
@@ -847,8 +988,9 @@ class Solar_String():
             self.cell_height = cell_height
             self.cell_width = cell_width
 
-            #calculate overall initial conditions once for speed
-            initial_conditions = library_conditions(panel_name, 950, 25)
+            #calculate overall initial conditions once for speed, reusing the shared record if built
+            record = Solar_Cell._records.get((panel_name, 950, 25))
+            initial_conditions = record[:5] if record else library_conditions(panel_name, 950, 25)
 
             #find max of cells per module
             cells_per_module = row_module * 6
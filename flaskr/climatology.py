@@ -0,0 +1,160 @@
+import os
+import json
+import threading
+
+'''
+local cache of the nasa power monthly high/low temperatures used for the ambient
+temperature curve, so modelling never waits on the network
+
+entries are keyed by lat/lon rounded to the nasa power grid and the month
+the bundled seed file is read first, then the cache file written by fetches
+on a miss the default is returned straight away and, unless offline, the
+location is fetched in the background for next time
+to bundle data for offline hosts, seed the cache with the __main__ below and
+ship the resulting file as climatology_seed.json (or point SOLAR_CLIMATE_SEED at it)
+'''
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+
+#settings, can be overridden from the environment
+_cache_path = os.environ.get('SOLAR_CLIMATE_CACHE',
+    os.path.join(_package_dir, '..', 'instance', 'climatology.json'))
+_seed_path = os.environ.get('SOLAR_CLIMATE_SEED',
+    os.path.join(_package_dir, 'climatology_seed.json'))
+_offline = os.environ.get('SOLAR_CLIMATE_OFFLINE', '0') == '1'
+_default = tuple(float(t) for t in os.environ.get('SOLAR_CLIMATE_DEFAULT', '25,15').split(','))
+
+#nasa power data is on a half degree grid
+_grid = 0.5
+_year = 2019
+
+#location key -> {month: [t_high, t_low]}
+_temps = None
+_lock = threading.Lock()
+#locations already fetched (or tried) by this process
+_attempted = set()
+
+#rounds a location onto the grid
+def _location_key(lat, lon):
+    lat = round(float(lat) / _grid) * _grid
+    lon = round(float(lon) / _grid) * _grid
+    return f'{lat:.1f},{lon:.1f}'
+
+#month as a two digit string, takes '01' or 1
+def _month_key(month):
+    return f'{int(month):02d}'
+
+def _read_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f'Failed to read climatology file {path} due to {e}')
+        return {}
+
+#loads the seed then the cache file once per process
+def _load():
+    global _temps
+    if _temps is None:
+        with _lock:
+            if _temps is None:
+                temps = _read_file(_seed_path)
+                for key, months in _read_file(_cache_path).items():
+                    temps.setdefault(key, {}).update(months)
+                _temps = temps
+    return _temps
+
+#writes the cache file, replacing it in one step so readers never see half a file
+def _save():
+    os.makedirs(os.path.dirname(_cache_path), exist_ok=True)
+    tmp_path = f'{_cache_path}.tmp'
+    with _lock:
+        with open(tmp_path, 'w') as f:
+            json.dump(_temps, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, _cache_path)
+
+'''
+@func fetches every month for a location from nasa power and adds it to the cache
+@params the lat/lon coordinates
+@output the dictionary of month -> [t_high, t_low]
+'''
+def fetch_location(lat, lon):
+    key = _location_key(lat, lon)
+    grid_lat, grid_lon = key.split(',')
+
+    #use nasa power parameters
+    #t2m_max is max and t2m_min min
+    params = ["T2M_MAX", "T2M_MIN"]
+
+    #the api url to request data from
+    url = (
+        f"https://power.larc.nasa.gov/api/temporal/monthly/point"
+        f"?parameters={','.join(params)}"
+        f"&community=AG"
+        f"&longitude={grid_lon}&latitude={grid_lat}"
+        f"&start={_year}&end={_year + 1}"
+        f"&format=JSON"
+    )
+    import requests
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    data = response.json()['properties']['parameter']
+
+    months = {}
+    for month in range(1, 13):
+        date_str = f'{_year}{month:02d}'
+        months[_month_key(month)] = [data['T2M_MAX'][date_str], data['T2M_MIN'][date_str]]
+
+    temps = _load()
+    with _lock:
+        temps[key] = months
+    _save()
+    return months
+
+#fetches a location on a background thread, only tried once per location per process
+def _fetch_in_background(lat, lon):
+    key = _location_key(lat, lon)
+    with _lock:
+        if key in _attempted:
+            return
+        _attempted.add(key)
+
+    def _run():
+        try:
+            fetch_location(lat, lon)
+            print(f'Cached climatology for {key}')
+        except Exception as e:
+            print(f'Failed to fetch climatology for {key} due to {e}')
+
+    threading.Thread(target=_run, daemon=True).start()
+
+'''
+@func finds the average monthly high and low temperature at a location
+@params the lat/lon coordinates and month ('01'-'12')
+@output the high and low, or the configured default if the location isn't cached
+'''
+def monthly_temps(lat, lon, month):
+    key = _location_key(lat, lon)
+    months = _load().get(key)
+    if months is not None and _month_key(month) in months:
+        t_high, t_low = months[_month_key(month)]
+        return t_high, t_low
+
+    print(f'No climatology cached for {key}, using default {_default}')
+    if not _offline:
+        _fetch_in_background(lat, lon)
+    return _default
+
+#seeds the cache from the command line, eg before moving to an offline host
+#python -m flaskr.climatology <lat> <lon> [<lat> <lon> ...]
+if __name__ == "__main__":
+    import sys
+    coords = sys.argv[1:]
+    if not coords or len(coords) % 2:
+        print("Usage: python -m flaskr.climatology <lat> <lon> [<lat> <lon> ...]")
+    else:
+        for lat, lon in zip(coords[::2], coords[1::2]):
+            print(f'{_location_key(lat, lon)}: {fetch_location(lat, lon)}')
+        print(f'Saved to {os.path.abspath(_cache_path)}')
@@ -1,29 +1,79 @@
-import pvlib
 import numpy as np
 import pandas as pd
 import os
-import difflib
-from flaskr.models import PanelInfo, CustomPanel
+import re
+import glob
+import time
+import hashlib
+from functools import lru_cache
+from flaskr.models import PanelInfo, CustomPanel, InverterInfo
 from . import db
+from .name_index import NameIndex
+import flaskr.param_grid as pg
+import flaskr.panel_search as ps
+import flaskr.surrogate as sg
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+
+#the catalogue sweep is written one file per panel so adding a panel never rewrites the others
+_csv_dir = os.environ.get('SOLAR_DATA_DIR', os.path.join(_package_dir, '..', 'instance', 'solar_data'))
+
+#the cec table, read once per process
+@lru_cache(maxsize=1)
+def _cec_modules():
+    import pvlib
+    return pvlib.pvsystem.retrieve_sam('CECMod')
+
+#near duplicate index of the library names for close match suggestions
+@lru_cache(maxsize=1)
+def _cec_name_index():
+    return NameIndex(_cec_modules().columns)
+
+#names that only differ in replaced characters (or case) would share a file, so the file
+#name ends with a hash of the full name
+def _csv_path(panel_name):
+    safe_name = re.sub(r'[^\w.-]', '_', panel_name)
+    digest = hashlib.sha1(panel_name.encode()).hexdigest()[:10]
+    return os.path.join(_csv_dir, f'{safe_name}_{digest}.csv')
+
+#marks a panel that can't be built from the library so a resumed sweep doesn't retry it
+def _skip_path(panel_name):
+    return _csv_path(panel_name)[:-len('.csv')] + '.skip'
+
+def _mark_skipped(panel_name, reason):
+    try:
+        os.makedirs(_csv_dir, exist_ok=True)
+        with open(_skip_path(panel_name), 'w') as f:
+            f.write(reason)
+    except Exception as e:
+        print(f'Failed to mark {panel_name} as skipped due to {e}')
 
 def create_csv_entry(panel_name):
-    cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
+
+    import pvlib
+
+    cec_modules = _cec_modules()
     #use a list of temperatures/irradiances to get results to place in the neural net
     temperatures = np.linspace(10, 50, 16)
     irrads = np.linspace(100, 1000, 36)
 
-    records = []
+    #already written by an earlier run
+    path = _csv_path(panel_name)
+    if os.path.exists(path):
+        print(f"{panel_name} already saved")
+        return 1
 
     try:
         #test for close matches first
         if panel_name not in cec_modules.columns:
             print(f"Panel '{panel_name}' not found in library.")
-            suggestions = difflib.get_close_matches(panel_name, cec_modules.columns, n=3)
+            suggestions = _cec_name_index().similar(panel_name, limit=3)
             if suggestions:
                 print("Did you mean:")
                 for suggestion in suggestions:
                     print(f"  - {suggestion}")
-            raise Exception
+            _mark_skipped(panel_name, 'not in library')
+            return 0
         else:
             print(f"{panel_name} found in library")
 
@@ -33,51 +83,51 @@ def create_csv_entry(panel_name):
         required = ['alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s']
         if not all(param in module and not pd.isna(module[param]) for param in required):
             print(F'Skipping {panel_name} as its missing parameters')
-            raise Exception
-
-        #iterate through each one outputting a record
-        for cell_t in temperatures:
-            for G in irrads:
-                Iph, Is, Rs, Rp, nNsVth = pvlib.pvsystem.calcparams_desoto(
-                    effective_irradiance = G,
-                    temp_cell = cell_t,
-                    alpha_sc=module['alpha_sc'],
-                    a_ref=module['a_ref'],
-                    I_L_ref=module['I_L_ref'],
-                    I_o_ref=module['I_o_ref'],
-                    R_sh_ref=module['R_sh_ref'],
-                    R_s=module['R_s'],
-                    EgRef=1.121,
-                    dEgdT=-0.0002677
-                )
-
-                #use nNsVth to estimate ideality
-                k = 1.380649e-23
-                q = 1.602e-19
-                T_K = cell_t + 273.15
-                Vth = k * T_K / q
-                Ns = module['N_s']
-                n = nNsVth / (Ns * Vth)
-
-                # Try to get height and width if they exist
-                length = module.get('Length', None)  # in mm
-                width = module.get('Width', None)    # in mm
-
-                Nd = max(1, Ns//20)
-
-                records.append([panel_name, G, cell_t, Iph, Is, n, Rs, Rp, Ns, Nd, length, width])
-
-        df = pd.DataFrame(records, columns=['name', 'G', 'T', 'Iph', 'Is', 'n', 'Rs', 'Rp', 'Ns', 'Nd', 'L(m)', 'W(m)'])
-
-        # If file exists, append to existing and is non empty else new entry made 
-        if os.path.exists('solar_data.csv') and os.path.getsize('solar_data.csv') > 0:
-            df_existing = pd.read_csv('solar_data.csv')
-            df_combined = pd.concat([df_existing, df], ignore_index=True)
-        else:
-            df_combined = df
+            _mark_skipped(panel_name, 'missing parameters')
+            return 0
 
-        # Write once
-        df_combined.to_csv('solar_data.csv', index=False)
+        #the whole grid in one call, temperature outer and irradiance inner as before
+        cell_t, G = (a.ravel() for a in np.meshgrid(temperatures, irrads, indexing='ij'))
+        Iph, Is, Rs, Rp, nNsVth = pvlib.pvsystem.calcparams_desoto(
+            effective_irradiance = G,
+            temp_cell = cell_t,
+            alpha_sc=module['alpha_sc'],
+            a_ref=module['a_ref'],
+            I_L_ref=module['I_L_ref'],
+            I_o_ref=module['I_o_ref'],
+            R_sh_ref=module['R_sh_ref'],
+            R_s=module['R_s'],
+            EgRef=1.121,
+            dEgdT=-0.0002677
+        )
+
+        #use nNsVth to estimate ideality
+        k = 1.380649e-23
+        q = 1.602e-19
+        T_K = cell_t + 273.15
+        Vth = k * T_K / q
+        Ns = module['N_s']
+        n = nNsVth / (Ns * Vth)
+
+        # Try to get height and width if they exist
+        length = module.get('Length', None)  # in mm
+        width = module.get('Width', None)    # in mm
+
+        Nd = max(1, Ns//20)
+
+        df = pd.DataFrame({
+            'name': panel_name, 'G': G, 'T': cell_t,
+            'Iph': Iph, 'Is': Is, 'n': n, 'Rs': Rs, 'Rp': Rp,
+            'Ns': Ns, 'Nd': Nd, 'L(m)': length, 'W(m)': width
+        })
+
+        #written under a temporary name so an interrupted run never leaves half a partition
+        os.makedirs(_csv_dir, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        if os.path.exists(_skip_path(panel_name)):
+            os.remove(_skip_path(panel_name))
         print(f"Successfully saved data for {panel_name}")
 
         return 1
@@ -86,7 +136,42 @@ def create_csv_entry(panel_name):
         print(f'Failed module {panel_name} because of {e}')
         return 0
 
+#sweeps the whole cec catalogue (or names) across a process pool
+#panels with a partition already written are skipped so an interrupted sweep can be rerun,
+#as are panels marked as not buildable unless retry_skipped, errors are always retried
+def build_csv_dataset(names=None, workers=None, retry_skipped=False):
+    from concurrent.futures import ProcessPoolExecutor
+
+    if names is None:
+        names = list(_cec_modules().columns)
+    saved = [name for name in names if os.path.exists(_csv_path(name))]
+    skipped = [] if retry_skipped else [name for name in names if os.path.exists(_skip_path(name))]
+    done = set(saved) | set(skipped)
+    todo = [name for name in names if name not in done]
+    print(f'{len(saved)} panels already saved, {len(skipped)} skipped, {len(todo)} to go')
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        saved = sum(pool.map(create_csv_entry, todo, chunksize=32))
+
+    print(f'Saved {saved} of {len(todo)} panels in {time.perf_counter() - start:.1f}s')
+    return saved
+
+#reads every partition back as one dataframe, eg for training
+def load_csv_dataset():
+    paths = sorted(glob.glob(os.path.join(_csv_dir, '*.csv')))
+    if not paths:
+        return pd.DataFrame(columns=['name', 'G', 'T', 'Iph', 'Is', 'n', 'Rs', 'Rp', 'Ns', 'Nd', 'L(m)', 'W(m)'])
+    return pd.concat((pd.read_csv(path) for path in paths), ignore_index=True)
+
 def library_conditions(panel_name, G, T):
+    #interpolate from the precomputed grid when (G, T) is on it
+    values = pg.module_params(panel_name, G, T)
+    if values is not None:
+        return values
+
+    import pvlib
+
     cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
     try:
         try: 
@@ -145,6 +230,8 @@ def library_conditions(panel_name, G, T):
 
 #gets the whole module lookup info
 def lib_mod_lookup(panel_name, G, T):
+    import pvlib
+
     cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
     try:
         module = cec_modules[panel_name]
@@ -167,108 +254,276 @@ def lib_mod_lookup(panel_name, G, T):
         print("Failed")
         return None
 
-#builds a database of panels at standard conditions
-def build_database_mod():
+#nan (missing in the sam table) is stored as null
+def _db_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+'''
+@func inserts and updates a table from a dataframe in one transaction, only rows that are
+    new or have a changed value are written, rows missing from the frame and values missing
+    (null) in the frame are left alone so hand entered data survives a refresh
+@params the model, the name column and a dataframe indexed by name with model columns
+@output lists of the names inserted and the names updated
+'''
+def _sync_table(model, key, frame):
+    columns = list(frame.columns)
+    existing = {}
+    for row in model.query.with_entities(model.id, getattr(model, key), *[getattr(model, c) for c in columns]):
+        #keep the first row if a name was loaded twice
+        existing.setdefault(row[1], row)
+
+    inserts = []
+    updates = []
+    updated = []
+    for name, values in zip(frame.index, frame.itertuples(index=False)):
+        values = {c: _db_value(v) for c, v in zip(columns, values)}
+        row = existing.get(name)
+        if row is None:
+            inserts.append({key: name, **values})
+            continue
+
+        changed = {c: v for i, (c, v) in enumerate(values.items()) if v is not None and v != row[i + 2]}
+        if changed:
+            updates.append({'id': row[0], **changed})
+            updated.append(name)
+
+    db.session.bulk_insert_mappings(model, inserts)
+    db.session.bulk_update_mappings(model, updates)
+    db.session.commit()
+
+    return [row[key] for row in inserts], updated
+
+#reads a sam table from pvlib, or from a newer sam csv dropped in at path
+def _sam_table(name, path=None):
+    import pvlib
+    if path is None:
+        return pvlib.pvsystem.retrieve_sam(name)
+    return pvlib.pvsystem.retrieve_sam(path=path)
+
+#panel_info columns that hold whole numbers
+_integer_metadata = ['num_cells', 'num_diodes']
+
+'''
+@func reads the panel_info metadata columns from the CEC module table, shared by the
+    database build and the editing_db backfill so both read the library the same way
+    bypass diodes aren't in the CEC data, so they're estimated as one per 20 cells
+@params the transposed CEC table (one row per module)
+@output dataframe of length, width, num_cells, num_diodes and noct indexed by name, nan where missing
+'''
+def panel_metadata(cec_modules):
+    def column(name):
+        return pd.to_numeric(cec_modules[name], errors='coerce') if name in cec_modules else np.nan
+
+    Ns = column('N_s')
+    return pd.DataFrame({
+        'length': column('Length'),
+        'width': column('Width'),
+        'num_cells': Ns,
+        'num_diodes': np.maximum(1, Ns // 20),
+        'noct': column('T_NOCT'),
+    }, index=cec_modules.index)
+
+#builds (or refreshes) the database of panels at standard conditions
+#path is an optional newer sam module csv, only new or changed panels are written
+def build_database_mod(path=None):
     from flaskr import create_app
     app = create_app()
 
-    cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
+    start = time.perf_counter()
+    cec_modules = _sam_table('CECMod', path).T
 
-    records = []
+    frame = panel_metadata(cec_modules)
+    frame = frame[~frame.index.duplicated(keep='first')].astype(object)
+    frame[_integer_metadata] = frame[_integer_metadata].map(lambda v: None if pd.isna(v) else int(v))
 
     with app.app_context():
-        try:         
-            for name in cec_modules:
-                module = cec_modules[name]
-
-                Ns = module['N_s']
+        try:
+            #max power over the same parameters so a changed panel is picked up
+            params = cec_modules[_required_params].apply(pd.to_numeric, errors='coerce')
+            frame['max_power'] = stc_max_power(params[~params.index.duplicated(keep='first')])
 
-                # Try to get height and width if they exist
-                length = module.get('Length', None)  # in mm
-                width = module.get('Width', None)    # in mm
+            inserted, updated = _sync_table(PanelInfo, 'panel_name', frame)
 
-                Nd = max(1, Ns//20)
+            #anything built from the old parameters is stale
+            for name in updated:
+                pg.invalidate(name)
+                sg.invalidate(name)
+            ps.invalidate_index()
 
-                new_record = PanelInfo(
-                    panel_name=name,
-                    length=length,
-                    width=width,
-                    num_cells=Ns,
-                    num_diodes=Nd
-                )
-                db.session.add(new_record)
-                print(f"Successfully saved data for {name}")
-
-            db.session.commit()
+            print(f'Inserted {len(inserted)} and updated {len(updated)} of {len(frame)} panels '
+                f'in {time.perf_counter() - start:.2f}s')
+            return len(inserted), len(updated)
 
         except Exception as e:
+            db.session.rollback()
             print(f'Failed because of {e}')
 
 
+#the cec parameters needed to run calcparams_desoto
+_required_params = ['alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s']
+
+#gets the module parameters of cec and custom panels as one dataframe indexed by panel name
+#if names is given only those panels are returned
+def module_params(names=None):
+    cec_modules = _cec_modules().T
+    cec_params = cec_modules[_required_params]
+
+    custom_panels = CustomPanel.query.all()
+    if names is not None:
+        names = set(names)
+        cec_params = cec_params[cec_params.index.isin(names)]
+        custom_panels = [rec for rec in custom_panels if rec.panel_name in names]
+
+    #custom panels store the same parameters under different names
+    custom_params = pd.DataFrame([
+        {'name': rec.panel_name, 'alpha_sc': rec.alpha_sc, 'a_ref': rec.a_ref, 'I_L_ref': rec.i_l_ref,
+            'I_o_ref': rec.i_o_ref, 'R_sh_ref': rec.r_sh_ref, 'R_s': rec.r_s}
+        for rec in custom_panels
+    ], columns=['name'] + _required_params).set_index('name')
+
+    params = cec_params.astype(float)
+    if not custom_params.empty:
+        params = pd.concat([params, custom_params.astype(float)])
+
+    return params[~params.index.duplicated(keep='first')]
+
+#calculates the max power of every module in params as one array operation
+#params is a dataframe from module_params, defaults to standard test conditions
+def stc_max_power(params, G=1000, T=25):
+    import pvlib
+
+    params = params.dropna(subset=_required_params)
+
+    Iph, Is, Rs, Rp, nNsVth = pvlib.pvsystem.calcparams_desoto(
+        effective_irradiance = G,
+        temp_cell = T,
+        alpha_sc=params['alpha_sc'].to_numpy(),
+        a_ref=params['a_ref'].to_numpy(),
+        I_L_ref=params['I_L_ref'].to_numpy(),
+        I_o_ref=params['I_o_ref'].to_numpy(),
+        R_sh_ref=params['R_sh_ref'].to_numpy(),
+        R_s=params['R_s'].to_numpy(),
+        EgRef=1.121,
+        dEgdT=-0.0002677
+    )
+
+    result = pvlib.pvsystem.singlediode(
+        photocurrent=Iph,
+        saturation_current=Is,
+        resistance_series=Rs,
+        resistance_shunt=Rp,
+        nNsVth=nNsVth
+    )
+
+    return pd.Series(np.asarray(result['p_mp'], dtype=float), index=params.index)
+
+#precomputes the stc max power of every panel then bulk updates panel_info in one transaction
+#if names is given only those panels are updated
+def build_max_power(names=None):
+    from flaskr import create_app
+    app = create_app()
+
+    with app.app_context():
+        start = time.perf_counter()
+        max_powers = stc_max_power(module_params(names)).to_dict()
+        calc_time = time.perf_counter() - start
+
+        panels = PanelInfo.query.with_entities(PanelInfo.id, PanelInfo.panel_name).all()
+        mappings = [
+            {'id': p.id, 'max_power': max_powers[p.panel_name]}
+            for p in panels if p.panel_name in max_powers
+        ]
+
+        db.session.bulk_update_mappings(PanelInfo, mappings)
+        db.session.commit()
+
+        print(f'Calculated {len(max_powers)} max powers in {calc_time:.2f}s, updated {len(mappings)} panels')
+
+    return len(mappings)
+
 #uses the input dc and the inverter name to test output power
+#in_p can be a single power or an array of them
 def find_ac_power(inverter_name, in_p):
-    try:
-        #test for close matches first
-        if inverter_name not in inverters.columns:
-            print(f"Panel '{inverter_name}' not found in library.")
-            suggestions = difflib.get_close_matches(inverter_name, inverters.columns, n=3)
-            if suggestions:
-                print("Did you mean:")
-                for suggestion in suggestions:
-                    print(f"  - {suggestion}")
-            raise Exception
-        else:
-            print(f"{inverter_name} found in library")
-
-        inverter = inverters[inverter_name]
+    import flaskr.inverter as inv
 
+    try:
+        inverter = inv.get_inverter(inverter_name)
         print(f"Rated power of inverter is {inverter['Pdco']} W")
 
-        AC_P = pvlib.inverter.pvwatts(in_p, inverter['Pdco'])
+        AC_P = inv.ac_power(in_p, None, inverter, model='pvwatts')['ac_power']
+        if np.ndim(in_p) == 0:
+            AC_P = float(AC_P)
 
         #also want the voltage
         AC_V = inverter['Vac']
         print(f'Power {AC_P} voltage {AC_V}')
-        
+
         return AC_P, AC_V
     except Exception as e:
-        print(f'{inverter_name} not found')
+        print(f'Failed to find ac power for {inverter_name} due to {e}')
 
-def build_database_inverter():
-    inverters = pvlib.pvsystem.retrieve_sam('CECInverter')
+#sam inverter columns kept in inverter_info
+_inverter_columns = {'Vac': 'vac', 'Paco': 'paco', 'Pdco': 'pdco', 'Vdco': 'vdco', 'Pso': 'pso',
+    'C0': 'c0', 'C1': 'c1', 'C2': 'c2', 'C3': 'c3', 'Pnt': 'pnt', 'Vdcmax': 'vdcmax',
+    'Idcmax': 'idcmax', 'Mppt_low': 'mppt_low', 'Mppt_high': 'mppt_high'}
+
+#builds (or refreshes) inverter_info and the inverter csv
+#path is an optional newer sam inverter csv, only new or changed inverters are written
+def build_database_inverter(path=None):
+    from flaskr import create_app
+    app = create_app()
 
-    records = []
+    start = time.perf_counter()
+    inverters = _sam_table('CECInverter', path).T
+    inverters = inverters[~inverters.index.duplicated(keep='first')]
+    frame = inverters[list(_inverter_columns)].apply(pd.to_numeric, errors='coerce').rename(columns=_inverter_columns)
+
+    with app.app_context():
+        try:
+            inserted, updated = _sync_table(InverterInfo, 'inverter_name', frame.astype(object))
+            import flaskr.inverter as inv
+            for name in updated:
+                inv.invalidate(name)
+            print(f'Inserted {len(inserted)} and updated {len(updated)} of {len(frame)} inverters '
+                f'in {time.perf_counter() - start:.2f}s')
+        except Exception as e:
+            db.session.rollback()
+            print(f'Failed because of {e}')
+            return None
+
+    df = pd.DataFrame({
+        'Name': frame.index,
+        'AC V output': frame['vac'].to_numpy(),
+        'Rated AC power at STC': frame['paco'].to_numpy(),
+        'Rated DC V at STC': frame['pdco'].to_numpy(),
+        'Max DC V': frame['vdcmax'].to_numpy(),
+        'Max DC I': frame['idcmax'].to_numpy(),
+        'Lower MPPT V': frame['mppt_low'].to_numpy(),
+        'Upper MPPT V': frame['mppt_high'].to_numpy()
+    })
 
-    for name in inverters.columns:
-        inverter = inverters[name]
-        AC_V = inverter['Vac']
-        AC_P_rated = inverter['Paco']
-        DC_V_rated = inverter['Pdco']
-        V_max = inverter['Vdcmax']
-        I_max = inverter['Idcmax']
-        low_mpp = inverter['Mppt_low']
-        high_mpp = inverter['Mppt_high']
-
-        records.append([name, AC_V, AC_P_rated, DC_V_rated,
-                       V_max, I_max, low_mpp, high_mpp])
-        print(f'added {name}')
-        
-    df = pd.DataFrame(records, columns=['Name', 'AC V output', 'Rated AC power at STC', 'Rated DC V at STC', 'Max DC V',
-                                        'Max DC I', 'Lower MPPT V', 'Upper MPPT V'])
-    
     df.to_csv('Inverter_Database.csv')
     print("Saved data succesfully")
+    return len(inserted), len(updated)
     
 def build_database():
     build_database_inverter()
     build_database_mod()
 
 def attempt():
+
+    import pvlib
+
     sand_modules = pvlib.pvsystem.retrieve_sam(path='/workspaces/Solar_Site/PV_Module_List_Full_Data_ADA.xlsx')
     print(sand_modules.keys())
     #print([model for model in sand_modules.keys() if 'KM550' in model])
 
 def print_cec_module_params(panel_name):
+
+    import pvlib
+
     # Retrieve the CEC module database
     cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
     
@@ -1,43 +1,30 @@
-import pvlib
-from pvlib.location import Location
 from datetime import datetime, timedelta
 import pytz
 from pathlib import Path
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
 import shelve
 from .models import EnvironmentalData
 from flask import current_app
 from . import db
-from timezonefinder import TimezoneFinder
+import flaskr.refactored_helper as rh
+import flaskr.weather_store as ws
 import numpy as np
-import requests
+import flaskr.climatology as climatology
 from zoneinfo import ZoneInfo
-from scipy.optimize import least_squares
-from pvlib.ivtools.sdm import fit_cec_sam
 import math
-from pvlib.pvsystem import calcparams_cec, singlediode
 
 #use pvlib to find irradiance and temperature of longitude and latitude for a day
+#read from the local weather store, pvgis is only called the first time a site is seen
 def get_info(start, end, lat, long):
     start = start.replace(year=2021) 
     end = end.replace(year=2021)
-    data, metadata = pvlib.iotools.get_pvgis_hourly(
-        latitude=lat,
-        longitude=long,
-        start=start.year,
-        end=end.year
-    )
 
     #need to add a timezone to test between
     start = start.replace(tzinfo=pytz.UTC)
     end = end.replace(tzinfo=pytz.UTC)
 
-    #filter dates with timezone
-    data = data[(data.index >= start) & (data.index <= end)]
-
-    return data
+    return ws.get_hourly(lat, long, start, end)
 
 #adjust information to get only the total irradiance and temperature of the location given a date
 def adjust_df(df):
@@ -50,52 +37,69 @@ def adjust_df(df):
 
     return filtered
 
+#columns of the pvgis frame that are interpolated
+_weather_columns = ('Total Irradiance (W/m2)', 'Temperature (°C)')
+
 #interpolate temperature and irradiance between points
-def interpolate_df(df, timestep=10):
+#linear in time, keeps the original rows and fills the steps between them
+#steps are every timestep (minutes) from the first point unless the times are given
+def interpolate_df(df, timestep=10, columns=_weather_columns, steps=None):
     # Ensure the index is sorted and datetime-aware
     df = df.sort_index()
     df.index = pd.to_datetime(df.index)
+    df = df[~df.index.duplicated(keep='first')]
 
-    # Store new interpolated rows
-    new_rows = []
-
-    # Get all index values
-    idx = df.index
-    num_points = int(60 / timestep)
-    end = idx[-1]
+    if len(df) < 2:
+        return df
 
-    for i, hour in enumerate(idx[:-1]):
-        try:
-            current = df.loc[hour]
-            next_hour = idx[i + 1]
-            next_row = df.loc[next_hour]
+    # Every timestep from the first point, plus the original points
+    if steps is None:
+        steps = pd.date_range(df.index[0], df.index[-1], freq=pd.Timedelta(minutes=timestep))
+    full_df = df.reindex(df.index.union(steps))
 
-            # Compute changes per timestep
-            temp_change = (next_row['Temperature (°C)'] - current['Temperature (°C)']) / num_points
-            irr_change = (next_row['Total Irradiance (W/m2)'] - current['Total Irradiance (W/m2)']) / num_points
+    # Seconds from the start, interpolating in one pass per column
+    known = np.asarray((df.index - df.index[0]).total_seconds(), dtype=float)
+    wanted = np.asarray((full_df.index - df.index[0]).total_seconds(), dtype=float)
+    for column in columns:
+        full_df[column] = np.interp(wanted, known, df[column].to_numpy(dtype=float))
 
-            for j in range(1, num_points):
-                new_time = hour + timedelta(minutes=j * timestep)
-                new_temp = current['Temperature (°C)'] + j * temp_change
-                new_irr = current['Total Irradiance (W/m2)'] + j * irr_change
-                new_rows.append((new_time, new_irr, new_temp))
+    return full_df
 
-        except Exception as e:
-            print(f'Error interpolating between {hour} and next: {e}')
-            continue
+'''
+@func streams the pvgis weather of a range a month at a time, interpolated onto the steps of
+    the time series, so a multi year run only ever holds one month of steps and hours
+    missing years are imported into the weather store the first time they're read
+@params lat/lon, the timezone aware start/end and the timestep (timedelta)
+@output generator of dataframes, plane of array irradiance (irr) and ambient temperature (temp)
+    indexed by the step times, one per calendar month
+'''
+def iter_weather(lat, lon, start, end, timestep):
+    time = start
+    while time <= end:
+        #the steps are added like the time series loop does, up to the next month
+        month_end = (time.replace(day=1, hour=0, minute=0, second=0, microsecond=0) + timedelta(days=32)).replace(day=1)
+        steps = []
+        while time <= end and time < month_end:
+            steps.append(time)
+            time += timestep
+        #through utc as the offsets change across daylight saving, wall clock steps in
+        #the skipped hour land on the same instants as the hour after
+        index = pd.to_datetime(steps, utc=True)
 
-    # Create DataFrame of new rows
-    interp_df = pd.DataFrame(
-        new_rows,
-        columns=['index', 'Total Irradiance (W/m2)', 'Temperature (°C)']
-    ).set_index('index')
+        #an hour either side so the first and last steps sit between two pvgis hours
+        hourly = ws.get_hourly(lat, lon, index[0] - timedelta(hours=1), index[-1] + timedelta(hours=1))
+        if hourly.empty:
+            raise ValueError(f'No pvgis weather for {lat}, {lon} between {steps[0]} and {steps[-1]}')
 
-    # Combine and sort
-    full_df = pd.concat([df, interp_df])
-    full_df = full_df.sort_index()
-    full_df = full_df[~full_df.index.duplicated(keep='first')]
+        weather = pd.DataFrame({
+            'irr': hourly['poa_direct'] + hourly['poa_sky_diffuse'] + hourly['poa_ground_diffuse'],
+            'temp': hourly['temp_air'],
+        }, index=hourly.index)
+        weather = interpolate_df(weather, columns=('irr', 'temp'), steps=index.unique())
 
-    return full_df
+        chunk = weather.loc[index, ['irr', 'temp']]
+        chunk.index = index.tz_convert(steps[0].tzinfo)
+        yield chunk
 
 #store information into a csv file
 def create_edatabase(start, end, lat, lon):
@@ -105,32 +109,45 @@ def create_edatabase(start, end, lat, lon):
     df = get_info(start, end, lat, lon)
     filtered = adjust_df(df)
     
-    #store in the database
+    #store in the database, one query for the dates already stored then one bulk insert
     with current_app.app_context():
-        for i, (index, row) in enumerate(filtered.iterrows()):
-            exists = EnvironmentalData.query.filter_by(
-                date=index.replace(year=2025),
-                latitude=lat,
-                longitude=lon
-            ).first()
-            
-            if not exists:
-                record = EnvironmentalData(
-                    date = index,
-                    hour = i,
-                    longitude=lon,
-                    latitude=lat,
-                    temperature=row['Temperature (°C)'],
-                    irradiance=row['Total Irradiance (W/m2)']
-                )
-                db.session.add(record)
-        
+        dates = [index.to_pydatetime().replace(tzinfo=None) for index in filtered.index]
+        if not dates:
+            return filtered
+
+        existing = {
+            row.date for row in EnvironmentalData.query.with_entities(EnvironmentalData.date).filter(
+                EnvironmentalData.latitude == lat,
+                EnvironmentalData.longitude == lon,
+                EnvironmentalData.date.between(min(dates), max(dates))
+            )
+        }
+
+        temps = filtered['Temperature (°C)'].to_numpy(dtype=float)
+        irrs = filtered['Total Irradiance (W/m2)'].to_numpy(dtype=float)
+        records = [
+            {
+                'date': date,
+                'hour': i,
+                'longitude': lon,
+                'latitude': lat,
+                'temperature': float(temps[i]),
+                'irradiance': float(irrs[i])
+            }
+            for i, date in enumerate(dates)
+            if date not in existing
+        ]
+
+        if records:
+            db.session.bulk_insert_mappings(EnvironmentalData, records)
         db.session.commit()
     
     return filtered
 
 #draws the graphs
 def draw_graph(powers, voltages, currents, type, panel_name):
+    import matplotlib.pyplot as plt
+
     output_dir = f'flaskr/static/plots/{panel_name}'
     os.makedirs(output_dir, exist_ok=True)
 
@@ -286,10 +303,9 @@ def get_times(filename):
 
     return df
 
+#shares the cached finder in refactored_helper
 def get_timezone(lat, lon):
-    tf = TimezoneFinder()
-    timezone_str = tf.timezone_at(lat=lat, lng=lon)
-    return timezone_str
+    return rh._get_timezone(lat, lon)
 
 #interpolate change in temp/irradiance
 #if timestep between hours
@@ -314,6 +330,9 @@ def interpolate(timestep, temp_change, irr_change, start, end,
 #using clearsky from pvlib to get more accurate conditions
 def get_irr(start_date, end_date, lat, lon, timestep, 
         timestep_unit, timezone):
+    import pvlib
+    from pvlib.location import Location
+
     #define the location
     site = Location(lat, lon, tz=timezone)
 
@@ -488,48 +507,9 @@ def _key_from_floats(*numbers, prec=2):
 def _floats_from_key(key: str):
     return tuple(float(x) for x in key.split("|"))
 
-#using nasa api to request temperature infromation for a year 
+#monthly high and low temperature from the local nasa power cache
 def get_avg_temp(lat=24, lon=69, month='01'):
-
-    start_year = 2019
-    end_year = 2020
-
-    #use nasa power parameters
-    #t2m_max is max and t2m_min min
-    params = ["T2M_MAX", "T2M_MIN"]
-
-    #the api url to request data from
-    url = (
-        f"https://power.larc.nasa.gov/api/temporal/monthly/point"
-        f"?parameters={','.join(params)}"
-        f"&community=AG"
-        f"&longitude={lon}&latitude={lat}"
-        f"&start={start_year}&end={end_year}"
-        f"&format=JSON"
-    )
-
-    print("Fetching data")
-    response = requests.get(url)
-    data = response.json()
-
-    records = []
-    for date_str, values in data['properties']['parameter']['T2M_MAX'].items():
-        records.append({
-            'YearMonth': date_str,
-            'Tmax': values,
-            'Tmin': data['properties']['parameter']['T2M_MIN'][date_str]
-        })
-
-
-    #build a sin curve of temperatures between a low at 3am and a high at 3pm
-    filtered_records = []
-    for record in records:
-        if record['YearMonth'] == f'2019{month}':
-            filtered_records.append(record)
-
-    #get the high and low 
-    t_high = record['Tmax']
-    t_low = record['Tmin']
+    t_high, t_low = climatology.monthly_temps(lat, lon, month)
 
     print(f'high is {t_high}, low is {t_low}')
     
@@ -558,13 +538,6 @@ def khw_output(timestep, powers):
 #r_sh - shunt resistance (aka parallel resistance)
 #a_ref a reference ideality factor
 
-
-import math
-import numpy as np
-from pvlib.ivtools.sdm import fit_cec_sam
-from pvlib.pvsystem import calcparams_cec, singlediode
-import pvlib
-
 #used to get the correct params of a custom variable
 def custom_panel_variables(Voc, Isc, Vmp, Imp, N_cells, alpha_sc, cell_type, gamma_pmp, beta_voc):
     # Constants
@@ -580,6 +553,8 @@ def custom_panel_variables(Voc, Isc, Vmp, Imp, N_cells, alpha_sc, cell_type, gam
         return f"Failed due to {e}"
 
 def pvlib_extraction(Voc, Isc, Vmp, Imp, N_cells, alpha_sc, cell_type, gamma_pmp, beta_voc):
+    from pvlib.ivtools.sdm import fit_cec_sam
+
 
     params = {'gamma_pmp': gamma_pmp, 'beta_voc': beta_voc, 'alpha_sc': alpha_sc},
 
@@ -630,6 +605,8 @@ def param_extraction(Voc, Isc, Vmp, Imp, num_cells, alpha_sc_percent, beta_voc_p
 
 def calculate_pmp_simple(I_L_ref, I_o_ref, R_s, R_sh_ref, a_ref,
                         temp_cell=25, irradiance=1000, alpha_sc=0.006445):
+    from pvlib.pvsystem import calcparams_cec, singlediode
+
     # Calculate parameters at operating conditions
     photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth = calcparams_cec(
         effective_irradiance=irradiance,
@@ -0,0 +1,159 @@
+import math
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from flaskr.models import InverterInfo
+from flaskr.get_data import _inverter_columns, _sam_table
+from flaskr.name_index import NameIndex
+
+'''
+inverter stage of the time series, turns the string's dc max power into ac
+
+the whole series goes through pvlib's sandia (or pvwatts) model in one call,
+points where the mpp voltage is outside the inverter's mppt window are moved
+to the window edge first and the dc input is clipped at the rated input
+inverter parameters come from inverter_info, or the sam library if it hasn't
+been built, and are kept per process
+'''
+
+#inverter name -> sam style parameters
+_inverters = {}
+
+#the sam library, only read when inverter_info doesn't have the inverter
+@lru_cache(maxsize=1)
+def _sam_inverters():
+    return _sam_table('CECInverter')
+
+@lru_cache(maxsize=1)
+def _sam_name_index():
+    return NameIndex(_sam_inverters().columns)
+
+'''
+@func reads an inverter's parameters, needs an app context for inverter_info
+@params the inverter name
+@output dictionary of sam parameters (Paco, Pdco, Vdco, Pso, C0-C3, Pnt, Vac, Vdcmax, Idcmax, Mppt_low, Mppt_high)
+'''
+def get_inverter(inverter_name):
+    inverter = _inverters.get(inverter_name)
+    if inverter is not None:
+        return inverter
+
+    record = InverterInfo.query.filter_by(inverter_name=inverter_name).first()
+    if record is not None:
+        #the columns are nullable, missing values are nan like the sam library
+        inverter = {sam: math.nan if getattr(record, column) is None else float(getattr(record, column))
+            for sam, column in _inverter_columns.items()}
+    else:
+        library = _sam_inverters()
+        if inverter_name not in library.columns:
+            suggestions = _sam_name_index().similar(inverter_name, limit=3)
+            raise ValueError(f"Inverter '{inverter_name}' not found in library"
+                + (f", did you mean {', '.join(suggestions)}" if suggestions else ''))
+        inverter = {sam: float(pd.to_numeric(library[inverter_name][sam], errors='coerce'))
+            for sam in _inverter_columns}
+
+    _inverters[inverter_name] = inverter
+    return inverter
+
+#drops cached inverters after inverter_info changes
+def invalidate(inverter_name=None):
+    if inverter_name is None:
+        _inverters.clear()
+    else:
+        _inverters.pop(inverter_name, None)
+
+#parameters each model can't run without
+_required = {
+    'sandia': ['Paco', 'Pdco', 'Vdco', 'Pso', 'C0', 'C1', 'C2', 'C3', 'Pnt'],
+    'pvwatts': ['Paco', 'Pdco'],
+}
+
+#missing (nan/None) parameters count as no limit
+def _limit(inverter, key, default):
+    value = inverter.get(key)
+    return default if value is None or np.isnan(value) else value
+
+'''
+@func runs the inverter over a dc time series in one pass
+@params the dc max power and mpp voltage arrays (voltage can be None for pvwatts), the
+    inverter parameters, the model ('sandia' or 'pvwatts') and the number of parallel strings
+@output dictionary of arrays - ac power (never negative), the power drawn at night (tare),
+    the dc power the inverter tracked, the ac power lost to clipping at the rated input
+    current or power and whether the mpp was inside the mppt window
+'''
+def ac_power(dc_power, dc_voltage, inverter, model='sandia', num_strings=1):
+    import pvlib
+
+    if model not in _required:
+        raise ValueError(f"Unknown inverter model '{model}', use 'sandia' or 'pvwatts'")
+    missing = [key for key in _required[model] if _limit(inverter, key, None) is None]
+    if missing:
+        raise ValueError(f"Inverter is missing {', '.join(missing)} needed by the {model} model")
+
+    p_dc = np.nan_to_num(np.asarray(dc_power, dtype=float)) * num_strings
+    paco = inverter['Paco']
+
+    if dc_voltage is None:
+        if model == 'sandia':
+            raise ValueError('The sandia model needs the dc voltage')
+        v_dc = None
+        in_window = np.ones(p_dc.shape, dtype=bool)
+    else:
+        v_mp = np.nan_to_num(np.asarray(dc_voltage, dtype=float))
+        low = _limit(inverter, 'Mppt_low', 0)
+        high = _limit(inverter, 'Mppt_high', np.inf)
+        v_max = _limit(inverter, 'Vdcmax', np.inf)
+        in_window = (v_mp >= low) & (v_mp <= high)
+
+        #above the window it runs at the top edge on the flat part of the curve (about Imp),
+        #below it the edge is past the knee so nothing is tracked, over Vdcmax it trips
+        v_dc = np.clip(v_mp, low, high)
+        scale = np.where(v_mp > high, high / np.where(v_mp > 0, v_mp, 1), 1.0)
+        p_dc = np.where((v_mp < low) | (v_mp > v_max), 0.0, p_dc * scale)
+
+    #when clipping the inverter moves off the mpp so it only draws its rated dc current
+    #and power, the rest is lost at about the nominal efficiency
+    pdco = inverter['Pdco']
+    available = p_dc
+    if v_dc is not None:
+        p_dc = np.minimum(p_dc, v_dc * _limit(inverter, 'Idcmax', np.inf))
+    p_dc = np.minimum(p_dc, pdco)
+    clipped = (available - p_dc) * paco / pdco
+
+    #both also cap the ac at Paco, sandia returns -Pnt without enough input
+    if model == 'sandia':
+        ac = pvlib.inverter.sandia(v_dc, p_dc, inverter)
+    else:
+        ac = pvlib.inverter.pvwatts(p_dc, pdco, eta_inv_nom=paco / pdco)
+
+    #the night tare comes back as negative ac, it's reported on its own so energy totals stay generation
+    ac = np.asarray(ac, dtype=float)
+
+    return {
+        'ac_power': np.maximum(ac, 0),
+        'tare': np.maximum(-ac, 0),
+        'dc_power': p_dc,
+        'clipped': clipped,
+        'in_window': in_window,
+    }
+
+'''
+@func adds the inverter output to a power over time dataframe like the ones _model_power_time writes
+@params the dataframe (pmax and vmp columns, one row per step), the inverter name, the timestep,
+    the model and the number of parallel strings
+@output the dataframe with ac_power (W), ac_energy (Wh per step), tare_energy (Wh drawn per step
+    at night), clipped (W) and in_mppt columns
+'''
+def inverter_stage(df, inverter_name, timestep, model='sandia', num_strings=1):
+    inverter = get_inverter(inverter_name)
+    dc_voltage = None if model == 'pvwatts' and 'vmp' not in df else pd.to_numeric(df['vmp'], errors='coerce')
+    result = ac_power(pd.to_numeric(df['pmax'], errors='coerce'), dc_voltage, inverter, model, num_strings)
+
+    hours = pd.Timedelta(timestep).total_seconds() / 3600
+    df = df.copy()
+    df['ac_power'] = result['ac_power']
+    df['ac_energy'] = result['ac_power'] * hours
+    df['tare_energy'] = result['tare'] * hours
+    df['clipped'] = result['clipped']
+    df['in_mppt'] = result['in_window']
+    return df
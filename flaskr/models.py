@@ -49,6 +49,9 @@ class EnvironmentalData(db.Model):
     temperature = db.Column(db.Float)
     irradiance = db.Column(db.Float)
 
+    __table_args__ = (
+        db.Index('envir_site_date_lookup', 'latitude', 'longitude', 'date'),
+    )
 
 class ModuleData(db.Model):
     __tablename__ = "module_data"
@@ -127,4 +130,61 @@ class WholeModuleLookup(db.Model):
 
     __table_args__ = (
         db.Index('whole_mod_key_lookup', 'panel_name', 'key'),
-    )
\ No newline at end of file
+    )
+
+#cached cec fits keyed by a hash of the datasheet inputs
+class PanelFit(db.Model):
+    __tablename__ = "panel_fit"
+
+    id = db.Column(db.Integer, primary_key=True)
+    fit_key = db.Column(db.String(64), nullable=False)
+    i_l_ref = db.Column(db.Float, nullable=False)
+    i_o_ref = db.Column(db.Float, nullable=False)
+    r_s = db.Column(db.Float, nullable=False)
+    r_sh_ref = db.Column(db.Float, nullable=False)
+    a_ref = db.Column(db.Float, nullable=False)
+    alpha_sc = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('panel_fit_lookup', 'fit_key', unique=True),
+    )
+
+#hourly pvgis weather imported once per site, read back by time range
+class WeatherData(db.Model):
+    __tablename__ = "weather_data"
+
+    id = db.Column(db.Integer, primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    time = db.Column(db.DateTime, nullable=False)
+    poa_direct = db.Column(db.Float)
+    poa_sky_diffuse = db.Column(db.Float)
+    poa_ground_diffuse = db.Column(db.Float)
+    solar_elevation = db.Column(db.Float)
+    temp_air = db.Column(db.Float)
+    wind_speed = db.Column(db.Float)
+
+    __table_args__ = (
+        db.Index('weather_site_time_lookup', 'latitude', 'longitude', 'time'),
+    )
+
+
+class InverterInfo(db.Model):
+    __tablename__ = "inverter_info"
+
+    id = db.Column(db.Integer, primary_key=True)
+    inverter_name = db.Column(db.String(200), nullable=False, unique=True)
+    vac = db.Column(db.Float)
+    paco = db.Column(db.Float)
+    pdco = db.Column(db.Float)
+    vdco = db.Column(db.Float)
+    pso = db.Column(db.Float)
+    c0 = db.Column(db.Float)
+    c1 = db.Column(db.Float)
+    c2 = db.Column(db.Float)
+    c3 = db.Column(db.Float)
+    pnt = db.Column(db.Float)
+    vdcmax = db.Column(db.Float)
+    idcmax = db.Column(db.Float)
+    mppt_low = db.Column(db.Float)
+    mppt_high = db.Column(db.Float)
@@ -0,0 +1,104 @@
+import re
+import difflib
+import numpy as np
+
+'''
+@class near duplicate index over panel/inverter names
+    names are normalised (lowercase letters and digits only) and split into
+    trigrams, postings per trigram answer "names like this one" for a single
+    query without scanning every name, and near duplicate grouping bounds the
+    difflib ratio with character counts so only likely pairs are compared
+@methods - similar() - closest names to a piece of text
+    - representatives() - one name per group of near duplicates
+'''
+class NameIndex():
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = [_normalise(name) for name in self.names]
+        self.grams = [_grams(key) for key in self.keys]
+
+        #trigram -> positions of the names containing it
+        postings = {}
+        for pos, grams in enumerate(self.grams):
+            for gram in grams:
+                postings.setdefault(gram, []).append(pos)
+        self.postings = {gram: np.array(p, dtype=np.int32) for gram, p in postings.items()}
+
+    '''
+    @func finds the names closest to some text, eg a mistyped panel name
+    @params the text, the number of names and the share of the text's trigrams a name must contain
+    @output names ordered by trigram overlap (dice), closest first
+    '''
+    def similar(self, text, limit=10, cutoff=0.6):
+        return [self.names[pos] for pos in self.similar_positions(text, limit, cutoff)]
+
+    #same as similar but the positions of the names
+    def similar_positions(self, text, limit=10, cutoff=0.6):
+        grams = _grams(_normalise(text))
+        postings = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not postings:
+            return []
+
+        positions, shared = np.unique(np.concatenate(postings), return_counts=True)
+        keep = shared >= cutoff * len(grams)
+        positions, shared = positions[keep], shared[keep]
+
+        sizes = np.array([len(self.grams[pos]) for pos in positions])
+        dice = 2 * shared / (len(grams) + sizes)
+        order = np.argsort(-dice, kind='stable')[:limit]
+        return [int(pos) for pos in positions[order]]
+
+    '''
+    @func keeps the first name of every group of near duplicates, in order, exactly like keeping
+        a name when difflib.SequenceMatcher(None, name, kept).ratio() < threshold for every kept name
+        the character count overlap (difflib's quick_ratio) is an upper bound of the ratio, so it
+        is checked against every kept name at once and the full ratio only runs where it could pass
+    @params the similarity threshold
+    @output the kept names
+    '''
+    def representatives(self, threshold=0.8):
+        #character counts of every name, case sensitive like difflib
+        alphabet = {c: i for i, c in enumerate(sorted({c for name in self.names for c in name}))}
+        counts = np.zeros((len(self.names), len(alphabet)), dtype=np.int16)
+        for pos, name in enumerate(self.names):
+            for c in name:
+                counts[pos, alphabet[c]] += 1
+        lengths = counts.sum(axis=1, dtype=np.int64)
+
+        #counts/lengths of the kept names in the first rows, filled as names are kept
+        kept_counts = np.zeros_like(counts)
+        kept_lengths = np.zeros(len(self.names), dtype=np.int64)
+        #matchers with the kept name as b, the side difflib caches
+        matchers = []
+        kept = []
+
+        for pos, name in enumerate(self.names):
+            count = len(kept)
+            shared = np.minimum(kept_counts[:count], counts[pos]).sum(axis=1)
+            bound = 2 * shared / np.maximum(kept_lengths[:count] + lengths[pos], 1)
+
+            #most likely matches first
+            duplicate = False
+            candidates = np.flatnonzero(bound >= threshold)
+            for k in candidates[np.argsort(-bound[candidates], kind='stable')]:
+                matcher = matchers[k]
+                matcher.set_seq1(name)
+                if matcher.ratio() >= threshold:
+                    duplicate = True
+                    break
+
+            if not duplicate:
+                kept_counts[count] = counts[pos]
+                kept_lengths[count] = lengths[pos]
+                matchers.append(difflib.SequenceMatcher(None, b=name))
+                kept.append(name)
+
+        return kept
+
+#lowercase letters and digits, so spacing/underscores/punctuation don't matter
+def _normalise(name):
+    return re.sub(r'[^a-z0-9]+', '', str(name).lower())
+
+#distinct three character windows
+def _grams(key):
+    return sorted({key[i:i + 3] for i in range(len(key) - 2)})
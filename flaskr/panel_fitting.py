@@ -0,0 +1,301 @@
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+from sqlalchemy.exc import IntegrityError
+from .models import PanelFit, PanelInfo, CustomPanel
+from . import db
+import flaskr.refactored_helper as hp
+import flaskr.panel_search as ps
+import flaskr.param_grid as pg
+import flaskr.surrogate as sg
+
+#fits held for the life of the process, backed by the panel_fit table
+_fit_cache = {}
+
+#background fit jobs by job id, oldest dropped first
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_max_jobs = 200
+_executor = None
+
+'''
+@func converts the /new_panel form (or a datasheet csv row with the same columns)
+    into the inputs used by the cec fit
+@params a mapping of the form fields
+@output a dictionary of the extraction arguments
+'''
+def _datasheet_from_form(form):
+    return {
+        'Voc': float(form['Voc']),
+        'Isc': float(form['Isc']),
+        'Vmp': float(form['Vmp']),
+        'Imp': float(form['Imp']),
+        'N_cells': int(form['num_cells']),
+        'alpha_sc': float(form['alpha_sc']),
+        'gamma_pmp': float(form['gamma_pmp']),
+        'beta_voc': float(form['beta_voc']),
+        'cell_type': form['panel_type'],
+    }
+
+'''
+@func hashes the datasheet inputs so identical datasheets share one fit
+@params the extraction arguments
+@output a hex string key
+'''
+def _fit_key(Voc, Isc, Vmp, Imp, N_cells, alpha_sc, gamma_pmp, beta_voc, cell_type):
+    values = "|".join(f"{float(x):.6g}" for x in (Voc, Isc, Vmp, Imp, N_cells, alpha_sc, gamma_pmp, beta_voc))
+    return hashlib.sha1(f"{values}|{str(cell_type).lower()}".encode()).hexdigest()
+
+'''
+@func looks for a fit in memory then in the panel_fit table
+@params the fit key
+@output I_L_ref, I_o_ref, R_s, R_sh_ref, a_ref, alpha_sc or None if never fitted
+'''
+def _lookup_fit(key):
+    if key in _fit_cache:
+        return _fit_cache[key]
+
+    record = PanelFit.query.filter_by(fit_key=key).first()
+    if record is None:
+        return None
+
+    params = (record.i_l_ref, record.i_o_ref, record.r_s, record.r_sh_ref,
+        record.a_ref, record.alpha_sc)
+    _fit_cache[key] = params
+    return params
+
+'''
+@func adds a fit to the memory cache and the session (caller commits), fit_key is unique so
+    when a concurrent fit of the same datasheet stored it first that row is kept
+@params the fit key and the fitted params
+@output the params kept for the key
+'''
+def _save_fit(key, params):
+    i_l_ref, i_o_ref, r_s, r_sh_ref, a_ref, alpha_sc = params
+    try:
+        #a savepoint so a clash only undoes this row, not the rest of the caller's session
+        with db.session.begin_nested():
+            db.session.add(PanelFit(
+                fit_key=key,
+                i_l_ref=i_l_ref,
+                i_o_ref=i_o_ref,
+                r_s=r_s,
+                r_sh_ref=r_sh_ref,
+                a_ref=a_ref,
+                alpha_sc=alpha_sc
+            ))
+    except IntegrityError:
+        _fit_cache.pop(key, None)
+        stored = _lookup_fit(key)
+        if stored is not None:
+            return stored
+
+    _fit_cache[key] = params
+    return params
+
+'''
+@func returns the cached fit of a datasheet without fitting
+@params the extraction arguments
+@output the fitted params or None
+'''
+def _cached_fit(**datasheet):
+    return _lookup_fit(_fit_key(**datasheet))
+
+'''
+@func fits a datasheet with fit_cec_sam, reusing and storing the cached result
+@params the extraction arguments
+@output I_L_ref, I_o_ref, R_s, R_sh_ref, a_ref, alpha_sc
+'''
+def _fit_datasheet(**datasheet):
+    key = _fit_key(**datasheet)
+    params = _lookup_fit(key)
+    if params is not None:
+        return params
+
+    params = hp._custom_panel_extraction(**datasheet)
+    if params is None:
+        raise ValueError("Failed parameter extraction")
+
+    params = _save_fit(key, params)
+    db.session.commit()
+    return params
+
+'''
+@func stores a fitted panel in the custom panel and panel info tables
+@params the panel dictionary (panel_name, length, width, num_cells, num_diodes, noct) and the fitted params
+@output the modelled max power, or None if the panel already exists
+'''
+def _store_panel(panel, params, commit=True):
+    i_l_ref, i_o_ref, r_s, r_sh_ref, a_ref, alpha_sc = params
+    panel_name = panel['panel_name']
+
+    #could have been added while the fit was running
+    if (PanelInfo.query.filter_by(panel_name=panel_name).first() or
+            CustomPanel.query.filter_by(panel_name=panel_name).first()):
+        print(f'{panel_name} already exists in the database')
+        return None
+
+    pmax, vmp, imp = hp._calculate_pmp_simple(i_l_ref, i_o_ref, r_s, r_sh_ref, a_ref, alpha_sc=alpha_sc)
+
+    db.session.add(CustomPanel(
+        panel_name=panel_name,
+        alpha_sc=alpha_sc,
+        a_ref=a_ref,
+        i_l_ref=i_l_ref,
+        i_o_ref=i_o_ref,
+        r_sh_ref=r_sh_ref,
+        r_s=r_s,
+        num_cells=panel['num_cells'],
+        num_diodes=panel['num_diodes']
+    ))
+
+    db.session.add(PanelInfo(
+        panel_name=panel_name,
+        length=panel['length'],
+        width=panel['width'],
+        num_cells=panel['num_cells'],
+        num_diodes=panel['num_diodes'],
+        max_power=float(pmax),
+        noct=panel['noct']
+    ))
+
+    #a grid or surrogate left from an earlier panel with this name would be stale
+    pg.invalidate(panel_name)
+    sg.invalidate(panel_name)
+
+    if commit:
+        db.session.commit()
+        ps.invalidate_index()
+
+    print(f'Stored {panel_name} with modelled Pmp = {pmax} W')
+    return pmax
+
+#records the state of a background job
+def _set_job(job_id, **values):
+    with _jobs_lock:
+        job = _jobs.setdefault(job_id, {'job_id': job_id})
+        job.update(values)
+        while len(_jobs) > _max_jobs:
+            _jobs.popitem(last=False)
+
+'''
+@func returns the state of a background fit
+@params the job id
+@output a dictionary with status pending/running/success/error, or None if unknown
+'''
+def _job_status(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='panel_fit')
+    return _executor
+
+'''
+@func fits a datasheet on a background worker then runs on_fit with the params
+    both run inside the app context so they can use the database
+@params the app, the extraction arguments, a callback taking the fitted params (returning
+    None when nothing was stored, which is reported as an error)
+@output the job id to poll with _job_status
+'''
+def _submit_fit(app, datasheet, on_fit=None, panel_name=None):
+    job_id = uuid.uuid4().hex
+    _set_job(job_id, status='pending', panel_name=panel_name)
+
+    def _run():
+        _set_job(job_id, status='running')
+        try:
+            with app.app_context():
+                params = _fit_datasheet(**datasheet)
+                result = on_fit(params) if on_fit is not None else params
+            #on_fit returns None when it stored nothing, eg the panel was added during the fit
+            if result is None:
+                _set_job(job_id, status='error', message='panel exists')
+            else:
+                _set_job(job_id, status='success')
+        except Exception as e:
+            print(f'Fit for {panel_name} failed: {e}')
+            _set_job(job_id, status='error', message=str(e))
+
+    _get_executor().submit(_run)
+    return job_id
+
+#fits one datasheet in a worker process, no database access
+def _fit_row(datasheet):
+    try:
+        return hp._custom_panel_extraction(**datasheet)
+    except Exception as e:
+        print(f'Failed parameter extraction: {e}')
+        return None
+
+'''
+@func imports a csv of datasheets (same columns as the /new_panel form), fitting every
+    row not already cached across a pool of processes then storing the panels in one commit
+@params the csv path and the number of processes (defaults to the cpu count)
+@output the number of panels added
+'''
+def batch_fit_datasheets(csv_path, processes=None):
+    from flaskr import create_app
+    app = create_app()
+
+    rows = pd.read_csv(csv_path).to_dict('records')
+
+    with app.app_context():
+        datasheets = []
+        keys = []
+        to_fit = {}
+
+        for row in rows:
+            datasheet = _datasheet_from_form(row)
+            key = _fit_key(**datasheet)
+            datasheets.append(datasheet)
+            keys.append(key)
+
+            if key not in to_fit and _lookup_fit(key) is None:
+                to_fit[key] = datasheet
+
+        print(f'{len(rows)} rows, {len(to_fit)} distinct datasheets need fitting')
+
+        #fit in parallel then save on this process
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = pool.map(_fit_row, to_fit.values(), chunksize=8)
+            for key, params in zip(to_fit.keys(), results):
+                if params is not None:
+                    _save_fit(key, params)
+
+        added = 0
+        for row, key in zip(rows, keys):
+            params = _fit_cache.get(key)
+            if params is None:
+                print(f"Skipping {row['panel_name']} as the fit failed")
+                continue
+
+            panel = {
+                'panel_name': row['panel_name'],
+                'length': float(row['panel_length']),
+                'width': float(row['panel_width']),
+                'num_cells': int(row['num_cells']),
+                'num_diodes': int(row['num_diodes']),
+                'noct': float(row['noct']),
+            }
+            if _store_panel(panel, params, commit=False) is not None:
+                added += 1
+
+        db.session.commit()
+        ps.invalidate_index()
+        print(f'Added {added} panels')
+
+    return added
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 2:
+        print("Usage: python -m flaskr.panel_fitting <datasheets.csv>")
+    else:
+        batch_fit_datasheets(sys.argv[1])
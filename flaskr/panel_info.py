@@ -1,10 +1,10 @@
-from flask import Blueprint, render_template, request, session, url_for, jsonify
+from flask import Blueprint, render_template, request, session, url_for, jsonify, current_app
 from .models import PanelInfo, CustomPanel
-from sqlalchemy import and_
-from .classes import Solar_Cell, Panel
+import flaskr.get_data as gd
 from . import db
 import math 
-import flaskr.refactored_helper as hp
+import flaskr.panel_fitting as pf
+import flaskr.panel_search as ps
 
 pi = Blueprint('panel_info', __name__)
 
@@ -15,10 +15,10 @@ def filter_data():
     return jsonify({"status": "success"})
 
 
+#filters the panels using the in memory search index
+#returns one page at a time, pass the returned next_cursor back as cursor for the next
 @pi.route('/build_data', methods=['POST'])
 def build_data():
-    print("This is running")
-
     #get the filters
     panel_name = request.form.get("panel_name", None)
 
@@ -28,66 +28,75 @@ def build_data():
         except (TypeError, ValueError):
             return None
 
+    def try_int(val, default):
+        try:
+            return int(val)
+        except (TypeError, ValueError):
+            return default
+
     power_input = try_float(request.form.get("power_input", None))
     width_input = try_float(request.form.get("width_input", None))
     height_input = try_float(request.form.get("height_input", None))
 
-    query = PanelInfo.query
-
-    #add filters to the list
-    filters = []
+    limit = min(max(try_int(request.form.get("limit"), 50), 1), 500)
+    cursor = try_int(request.form.get("cursor"), None)
 
-    if panel_name:
-        #contains substring
-        filters.append(PanelInfo.panel_name.ilike(f'%{panel_name}%'))
+    #close matches instead of substrings, also used when the substring finds nothing
+    fuzzy = request.form.get("fuzzy") == "1"
 
-    #tolerance for numbers 
-    tolerance = 0.1 #10% tolerance
-
-    if power_input is not None:
-        low = power_input * (1 - tolerance)
-        high = power_input * (1 + tolerance)
-        filters.append(PanelInfo.max_power.between(low, high))
-
-    if width_input is not None:
-        low = width_input * (1 - tolerance)
-        high = width_input * (1 + tolerance)
-        filters.append(PanelInfo.width.between(low, high))
-
-    if height_input is not None:
-        low = height_input * (1 - tolerance)
-        high = height_input * (1 + tolerance)
-        filters.append(PanelInfo.length.between(low, high))
+    try:
+        index = ps.get_index()
+        #tolerance for numbers is 10%
+        filters = dict(name=panel_name, power=power_input, width=width_input, length=height_input,
+            tolerance=0.1, limit=limit, cursor=cursor)
+        panels, next_cursor, total = index.search(**filters, fuzzy=fuzzy)
+        if panel_name and not fuzzy and total == 0 and cursor is None:
+            fuzzy = True
+            panels, next_cursor, total = index.search(**filters, fuzzy=True)
+    except Exception as e:
+        print(f'Failed to search panels due to {e}')
+        return jsonify({"status": "error", "message": str(e)})
 
-    if filters:
-        query = query.filter(and_(*filters))
+    return jsonify({"status": "success", "panels": panels,
+        "next_cursor": next_cursor, "total": total, "fuzzy": fuzzy})
 
-    panels = query.distinct().all()
+#autocomplete suggestions for the panel name boxes, served from the cached name list
+@pi.route('/panel_names', methods=['GET'])
+def panel_names():
+    text = request.args.get("q", "")
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+    except ValueError:
+        limit = 20
 
-    panel_info = [
-        {'name':p.panel_name, 'length':p.length, 'width':p.width, 'cells':p.num_cells, 'power':p.max_power}
-        for p in panels
-    ]
+    try:
+        names = ps.get_index().complete(text, limit)
+    except Exception as e:
+        print(f'Failed to complete panel names due to {e}')
+        return jsonify({"status": "error", "message": str(e)})
 
-    return jsonify(panel_info)
+    return jsonify({"status": "success", "names": names})
 
 @pi.route('/calc_power', methods=['POST'])
 def calc_power():
     panel_name = request.form.get("panel_name")
 
     panel = PanelInfo.query.filter_by(panel_name=panel_name).first()
-
-    test_cell = Solar_Cell(None, panel_name, 950, 25)
-    initial_conditions = test_cell.ACTUAL_CONDITIONS[:5]
-    test_panel = Panel(initial_conditions, panel_name=panel_name, module_count=panel.num_diodes,
-        cell_per_module=(panel.num_cells//panel.num_diodes))
-
-    pmax, vmp, imp = test_panel.model_power()
-    panel.max_power = pmax
-
-    db.session.commit()
-
-    return jsonify({'power': pmax})
+    if panel is None:
+        return jsonify({'status': 'error', 'message': f"Panel '{panel_name}' not found"})
+
+    #max power is precomputed by get_data.build_max_power, only fill in gaps
+    if panel.max_power is None:
+        #panels missing any cec parameter are dropped by stc_max_power
+        max_powers = gd.stc_max_power(gd.module_params([panel_name]))
+        max_power = max_powers.get(panel_name, math.nan)
+        if math.isnan(max_power):
+            return jsonify({'status': 'error', 'message': f"Panel '{panel_name}' has no model parameters"})
+        panel.max_power = float(max_power)
+        db.session.commit()
+        ps.invalidate_index()
+
+    return jsonify({'power': panel.max_power})
 
 #takes in inputs from a reference sheet to build a custom new panel
 #also needs to be added to the panel_info table
@@ -127,67 +136,37 @@ def new_panel():
     if existing_panel_info or existing_panel_custom:
         return jsonify({'status': 'error', 'message': 'Already exists in the database'})
 
-    try:
-        i_l_ref, i_o_ref, r_s, r_sh_ref, a_ref, alpha_sc = hp._custom_panel_extraction(Voc, Isc, Vmp, Imp, 
-                                                    num_cells, alpha_sc, beta_voc, gamma_pmp, panel_type)
-    except Exception as e:
-        print(f"failed due to {e}")
-        pass
-
-    # expected ideal Pmp
-    expected_pmp = Vmp * Imp
-    print(f"\nExpected Pmp = Vmp * Imp = {Vmp} * {Imp} = {expected_pmp:.1f} W")
-    print(f"\n Alpha sc is {alpha_sc}")
-
-    print(f"Storing module-level parameters for {panel_name}:")
-    print(f"  Alpha_sc = {alpha_sc} A/°C")
-    print(f"  a_ref = {a_ref}")
-    print(f"  I_L_ref = {i_l_ref} A")
-    print(f"  I_o_ref = {i_o_ref} A")
-    print(f"  R_s = {r_s} Ω")
-    print(f"  R_sh_ref = {r_sh_ref} Ω")
-    print(f"  Num cells = {num_cells}")
-    print(f"  Expected Pmp = {expected_pmp:.1f} W")
-
-
-    new_custom_record = CustomPanel(
-        panel_name = panel_name,
-        alpha_sc = alpha_sc,
-        a_ref = a_ref,
-        i_l_ref = i_l_ref,
-        i_o_ref = i_o_ref,
-        r_sh_ref = r_sh_ref,
-        r_s = r_s,
-        num_cells = num_cells,
-        num_diodes = num_diodes
-    )
-
-    db.session.add(new_custom_record)
-    db.session.commit()
-
-    pmax, vmp, imp = hp._calculate_pmp_simple(i_l_ref, i_o_ref, r_s, r_sh_ref, a_ref, alpha_sc=alpha_sc)
-
-    new_panel_record = PanelInfo(
-        panel_name=panel_name,
-        length=panel_length,
-        width=panel_width,
-        num_cells=num_cells,
-        num_diodes=num_diodes,
-        max_power=pmax,
-        noct=noct
-    )
-
-    print(f"\nMeasured/Modelled Pmp = {pmax} W")
-    print(f"Ratio measured/expected = {pmax/expected_pmp:.3f}")
-
-    db.session.add(new_panel_record)
-    db.session.commit()
-
-    return jsonify({'status': 'success'})
-
-
-    
-
-
-
-
+    datasheet = {
+        'Voc': Voc, 'Isc': Isc, 'Vmp': Vmp, 'Imp': Imp, 'N_cells': num_cells,
+        'alpha_sc': alpha_sc, 'gamma_pmp': gamma_pmp, 'beta_voc': beta_voc,
+        'cell_type': panel_type
+    }
+    panel = {
+        'panel_name': panel_name, 'length': panel_length, 'width': panel_width,
+        'num_cells': num_cells, 'num_diodes': num_diodes, 'noct': noct
+    }
+
+    print(f"\nExpected Pmp = Vmp * Imp = {Vmp} * {Imp} = {Vmp * Imp:.1f} W")
+
+    #an identical datasheet has been fitted before so store straight away
+    params = pf._cached_fit(**datasheet)
+    if params is not None:
+        if pf._store_panel(panel, params) is None:
+            return jsonify({'status': 'error', 'message': 'panel exists'})
+        return jsonify({'status': 'success'})
+
+    #otherwise fit in the background and let the page poll /fit_status
+    app = current_app._get_current_object()
+    job_id = pf._submit_fit(app, datasheet, lambda params: pf._store_panel(panel, params),
+        panel_name=panel_name)
+
+    return jsonify({'status': 'pending', 'job_id': job_id})
+
+#reports the progress of a background panel fit
+@pi.route('/fit_status/<job_id>', methods=['GET'])
+def fit_status(job_id):
+    job = pf._job_status(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Unknown fit job'}), 404
+
+    return jsonify(job)
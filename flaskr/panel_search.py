@@ -0,0 +1,220 @@
+import threading
+import numpy as np
+from .models import PanelInfo
+from .name_index import NameIndex
+
+#the process wide index, rebuilt when marked stale
+_index = None
+_stale = True
+_index_lock = threading.Lock()
+_build_lock = threading.Lock()
+
+#share of the typed name's trigrams a close match must contain
+_fuzzy_cutoff = 0.5
+
+'''
+@class in memory search index over panel_info
+    trigram postings for substring name search and sorted arrays for the
+    power/width/length range filters, so searches never touch the database
+@methods - search() - filtered, paginated rows
+    - names() - every panel name in id order
+    - distinct_names() - the cached sorted name list
+    - complete() - autocomplete suggestions
+    - name_index() - near duplicate index for fuzzy name search
+'''
+class PanelIndex():
+    def __init__(self, rows):
+        #rows are kept in id order so the cursor is a stable position
+        self.rows = [
+            {'name': r.panel_name, 'length': r.length, 'width': r.width,
+                'cells': r.num_cells, 'power': r.max_power}
+            for r in rows
+        ]
+        self.lower_names = [row['name'].lower() for row in self.rows]
+        self._distinct = None
+        self._name_index = None
+
+        #trigram -> positions of the names containing it
+        postings = {}
+        for pos, name in enumerate(self.lower_names):
+            for gram in set(_trigrams(name)):
+                postings.setdefault(gram, []).append(pos)
+        self.postings = {gram: np.array(p, dtype=np.int32) for gram, p in postings.items()}
+
+        #sorted copies of each numeric column for range lookups
+        self.sorted = {}
+        for key in ('power', 'width', 'length'):
+            values = np.array([np.nan if row[key] is None else row[key] for row in self.rows], dtype=float)
+            order = np.argsort(values, kind='stable')
+            #nan sorts to the end, leave it out of the ranges
+            valid = order[~np.isnan(values[order])]
+            self.sorted[key] = (values[valid], valid)
+
+    #every panel name
+    def names(self):
+        return [row['name'] for row in self.rows]
+
+    #distinct names in alphabetical order, worked out once per index
+    def distinct_names(self):
+        if self._distinct is None:
+            self._distinct = sorted(set(self.names()), key=str.lower)
+        return self._distinct
+
+    #built on the first fuzzy search, most searches never need it
+    def name_index(self):
+        if self._name_index is None:
+            self._name_index = NameIndex(self.names())
+        return self._name_index
+
+    '''
+    @func suggests panel names for an autocomplete box
+    @params the typed text and the number of suggestions
+    @output names starting with the text first, then names containing it
+    '''
+    def complete(self, text, limit=20):
+        names = self.distinct_names()
+        if not text:
+            return names[:limit]
+
+        lower = text.lower()
+        positions = self._name_matches(text)
+        matched = sorted({self.rows[pos]['name'] for pos in positions}, key=str.lower)
+
+        prefix = [name for name in matched if name.lower().startswith(lower)]
+        if len(prefix) >= limit:
+            return prefix[:limit]
+        rest = [name for name in matched if not name.lower().startswith(lower)]
+        return (prefix + rest)[:limit]
+
+    #positions whose name contains the text
+    def _name_matches(self, text):
+        text = text.lower()
+        grams = set(_trigrams(text))
+
+        #too short for trigrams so scan the names
+        if not grams:
+            return np.array([pos for pos, name in enumerate(self.lower_names) if text in name], dtype=np.int32)
+
+        candidates = None
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                return np.array([], dtype=np.int32)
+            candidates = posting if candidates is None else np.intersect1d(candidates, posting, assume_unique=True)
+
+        #trigrams can match out of order so confirm the substring
+        return np.array([pos for pos in candidates if text in self.lower_names[pos]], dtype=np.int32)
+
+    #positions whose value is within low-high
+    def _range_matches(self, key, low, high):
+        values, positions = self.sorted[key]
+        start = np.searchsorted(values, low, side='left')
+        end = np.searchsorted(values, high, side='right')
+        return positions[start:end]
+
+    '''
+    @func finds panels matching every filter given
+    @params name substring (or close match if fuzzy), power/width/length targets with a
+        relative tolerance, the page size and the cursor (position to continue after)
+    @output the page of rows, the next cursor (None at the end) and the total matches
+        close matches are ordered closest first, everything else in id order
+    '''
+    def search(self, name=None, power=None, width=None, length=None, tolerance=0.1,
+            limit=50, cursor=None, fuzzy=False):
+        mask = np.ones(len(self.rows), dtype=bool)
+
+        ranked = None
+        if name:
+            name_mask = np.zeros(len(self.rows), dtype=bool)
+            if fuzzy:
+                ranked = np.array(self.name_index().similar_positions(name, limit=None, cutoff=_fuzzy_cutoff),
+                    dtype=np.int32)
+                name_mask[ranked] = True
+            else:
+                name_mask[self._name_matches(name)] = True
+            mask &= name_mask
+
+        for key, target in (('power', power), ('width', width), ('length', length)):
+            if target is None:
+                continue
+            low, high = sorted((target * (1 - tolerance), target * (1 + tolerance)))
+            range_mask = np.zeros(len(self.rows), dtype=bool)
+            range_mask[self._range_matches(key, low, high)] = True
+            mask &= range_mask
+
+        if ranked is None:
+            matches = np.flatnonzero(mask)
+            total = len(matches)
+
+            if cursor is not None:
+                matches = matches[matches > cursor]
+
+            page = matches[:limit]
+            next_cursor = int(page[-1]) if len(matches) > limit else None
+        else:
+            #close matches come closest first, so the cursor is the number already sent
+            matches = ranked[mask[ranked]]
+            total = len(matches)
+            start = cursor or 0
+            page = matches[start:start + limit]
+            next_cursor = start + limit if total > start + limit else None
+
+        return [_json_row(self.rows[pos]) for pos in page], next_cursor, total
+
+#lowercase three character windows of a string
+def _trigrams(text):
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+#nan isn't valid json so send it as null
+def _json_row(row):
+    return {key: (None if isinstance(value, float) and np.isnan(value) else value)
+        for key, value in row.items()}
+
+'''
+@func builds the index from panel_info, needs an app context
+@params none
+@output the new index
+'''
+def build_index():
+    global _index, _stale
+    #cleared first so a change made mid build marks it stale again
+    _stale = False
+    rows = PanelInfo.query.with_entities(
+        PanelInfo.panel_name, PanelInfo.length, PanelInfo.width,
+        PanelInfo.num_cells, PanelInfo.max_power
+    ).order_by(PanelInfo.id).all()
+
+    index = PanelIndex(rows)
+    with _index_lock:
+        _index = index
+    print(f"Built panel search index of {len(index.rows)} panels")
+    return index
+
+'''
+@func returns the index, rebuilding it first if panels have changed
+@params none
+@output the index
+'''
+def get_index():
+    if _index is None or _stale:
+        #only one thread builds, the rest wait for it
+        with _build_lock:
+            if _index is None or _stale:
+                return build_index()
+    return _index
+
+#builds the index on a background thread so startup doesn't wait for it
+def warm_index(app):
+    def _run():
+        try:
+            with app.app_context():
+                get_index()
+        except Exception as e:
+            print(f'Failed to build panel search index due to {e}')
+
+    threading.Thread(target=_run, daemon=True, name='panel_index').start()
+
+#marks the index stale after panel_info changes
+def invalidate_index():
+    global _stale
+    _stale = True
@@ -0,0 +1,400 @@
+import os
+import re
+import math
+import zlib
+import bisect
+import sys
+import threading
+import numpy as np
+from flaskr.models import CustomPanel
+
+'''
+precomputed per panel grid of the desoto parameters and the single diode
+results over irradiance/temperature, so runtime lookups interpolate instead
+of calling calcparams_desoto point by point
+
+Iph and 1/Rp are linear in G and nNsVth in T, so bilinear interpolation is
+near exact for them, Is is interpolated in log space as it grows exponentially
+with temperature, points off the grid fall back to the exact pvlib result
+the voltages grow with log(G), so the irradiance steps are geometric up to
+25 W/m2 and the grid starts at 1 W/m2 rather than at 0 where they collapse
+grids are saved as .npz files so each panel is only computed once
+
+the cell voltage tables are the same idea one dimension up, v_from_i over
+current x irradiance x temperature, saved as .npy and memory mapped so every
+worker process reads the one copy through the page cache
+'''
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+
+#settings, can be overridden from the environment
+_enabled = os.environ.get('SOLAR_PARAM_GRID', '1') == '1'
+_grid_dir = os.environ.get('SOLAR_PARAM_GRID_DIR',
+    os.path.join(_package_dir, '..', 'instance', 'param_grids'))
+
+#grid axes, covers the shaded irradiance range and the cell temperature limits
+_irrads = np.concatenate([np.geomspace(1, 25, 15)[:-1], np.linspace(25, 1200, 48)])
+_temps = np.linspace(-15, 75, 37)
+_irrad_list = _irrads.tolist()
+_g_min, _g_max = _irrad_list[0], _irrad_list[-1]
+_t_min, _t_max, _t_step = float(_temps[0]), float(_temps[-1]), float(_temps[1] - _temps[0])
+
+#current axis of the voltage tables as a fraction of the photocurrent, the voltage falls
+#with log(1 - fraction) so the points bunch up geometrically towards 1, past 1 the cell is
+#reverse biased and the voltage is linear in the current
+_fractions = np.concatenate([1 - np.logspace(0, -12, 241), np.linspace(1, 1.2, 41)])
+_fraction_list = _fractions.tolist()
+
+#stored quantities, the first five are the module parameters as calcparams_desoto returns them
+_fields = ['Iph', 'Is', 'nNsVth', 'Rs', 'Rp', 'Pmax', 'Vmp', 'Imp', 'Voc', 'Isc']
+
+#panel name -> (table, Ns), the table has the fields along the last axis
+_grids = {}
+#panel name -> memory mapped voltage table
+_volumes = {}
+_lock = threading.Lock()
+
+#desoto reference parameters from the cec library or the custom panels table
+def _desoto_params(panel_name):
+    import pvlib
+
+    cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
+    if panel_name in cec_modules.columns:
+        module = cec_modules[panel_name]
+        return {
+            'alpha_sc': module['alpha_sc'],
+            'a_ref': module['a_ref'],
+            'I_L_ref': module['I_L_ref'],
+            'I_o_ref': module['I_o_ref'],
+            'R_sh_ref': module['R_sh_ref'],
+            'R_s': module['R_s'],
+        }, module['N_s']
+
+    record = CustomPanel.query.filter_by(panel_name=panel_name).first()
+    if record is None:
+        raise ValueError(f'{panel_name} not in library')
+    return {
+        'alpha_sc': record.alpha_sc,
+        'a_ref': record.a_ref,
+        'I_L_ref': record.i_l_ref,
+        'I_o_ref': record.i_o_ref,
+        'R_sh_ref': record.r_sh_ref,
+        'R_s': record.r_s,
+    }, record.num_cells
+
+#calcparams_desoto for arrays of G and T, broadcast to the same shape
+def _desoto(params, G, T):
+    import pvlib
+
+    Iph, Is, Rs, Rp, nNsVth = pvlib.pvsystem.calcparams_desoto(
+        effective_irradiance=G,
+        temp_cell=T,
+        EgRef=1.121,
+        dEgdT=-0.0002677,
+        **params
+    )
+    return np.broadcast_arrays(Iph, Is, Rs, Rp, nNsVth)
+
+#exact parameters and single diode results for arrays of G and T
+def _exact(params, G, T):
+    import pvlib
+
+    Iph, Is, Rs, Rp, nNsVth = _desoto(params, G, T)
+    shape = Iph.shape
+
+    #singlediode only takes flat arrays
+    out = pvlib.pvsystem.singlediode(*(np.ravel(a) for a in (Iph, Is, Rs, Rp, nNsVth)))
+    results = [np.reshape(np.asarray(out[c]), shape) for c in ('p_mp', 'v_mp', 'i_mp', 'v_oc', 'i_sc')]
+
+    return np.stack([Iph, Is, nNsVth, Rs, Rp] + results, axis=-1).astype(float)
+
+#interpolated form of the table, log(Is) and 1/Rp
+def _to_interp(table):
+    table = table.copy()
+    table[..., 1] = np.log(table[..., 1])
+    with np.errstate(divide='ignore'):
+        table[..., 4] = 1 / table[..., 4]
+    return table
+
+#undoes _to_interp for one interpolated row, plain floats are quicker than numpy here
+def _from_interp(values):
+    values = values.tolist()
+    values[1] = math.exp(values[1])
+    values[4] = 1 / values[4] if values[4] else math.inf
+    return values
+
+def _grid_path(panel_name):
+    return os.path.join(_grid_dir, re.sub(r'[^\w.-]', '_', panel_name) + '.npz')
+
+#the volume file doesn't store its axes, so they're part of the name and a change rebuilds it
+_volume_tag = f'{zlib.crc32(np.concatenate([_irrads, _temps, _fractions]).tobytes()):08x}'
+
+def _volume_path(panel_name):
+    return os.path.join(_grid_dir, re.sub(r'[^\w.-]', '_', panel_name) + f'_voltage_{_volume_tag}.npy')
+
+#grid cell of a point and its position inside it, the irradiance steps aren't even so they're searched
+def _position(G, T):
+    i = min(bisect.bisect_right(_irrad_list, G) - 1, len(_irrad_list) - 2)
+    dx = (G - _irrad_list[i]) / (_irrad_list[i + 1] - _irrad_list[i])
+    y = (T - _t_min) / _t_step
+    j = min(int(y), len(_temps) - 2)
+    return i, dx, j, y - j
+
+'''
+@func builds (or loads from disk) the grid of a panel, needs an app context for custom panels
+@params the panel name
+@output tuple of the interpolation table (len(G), len(T), fields) and the number of cells
+'''
+def get_grid(panel_name):
+    grid = _grids.get(panel_name)
+    if grid is not None:
+        return grid
+
+    path = _grid_path(panel_name)
+    try:
+        with np.load(path) as data:
+            if np.array_equal(data['G'], _irrads) and np.array_equal(data['T'], _temps):
+                grid = (data['table'], int(data['Ns']))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f'Failed to read parameter grid {path} due to {e}')
+
+    if grid is None:
+        params, Ns = _desoto_params(panel_name)
+        G, T = np.meshgrid(_irrads, _temps, indexing='ij')
+        with np.errstate(all='ignore'):
+            table = _to_interp(_exact(params, G, T))
+        grid = (table, int(Ns))
+
+        try:
+            os.makedirs(_grid_dir, exist_ok=True)
+            tmp_path = f'{path}.tmp.npz'
+            np.savez(tmp_path, G=_irrads, T=_temps, table=table, Ns=Ns)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f'Failed to save parameter grid {path} due to {e}')
+
+    with _lock:
+        _grids[panel_name] = grid
+    return grid
+
+'''
+@func bilinear lookup of every stored quantity at one irradiance/temperature
+@params panel name, irradiance and cell temperature
+@output dictionary of the fields, None if (G, T) is off the grid
+'''
+def lookup(panel_name, G, T):
+    if not (_g_min <= G <= _g_max and _t_min <= T <= _t_max):
+        return None
+    table, Ns = get_grid(panel_name)
+    i, dx, j, dy = _position(G, T)
+
+    values = ((table[i, j] * (1 - dx) + table[i + 1, j] * dx) * (1 - dy)
+        + (table[i, j + 1] * (1 - dx) + table[i + 1, j + 1] * dx) * dy)
+    return dict(zip(_fields, _from_interp(values)))
+
+'''
+@func module parameters in the order library_conditions returns them
+@params panel name, irradiance and cell temperature
+@output Iph, Is, nNsVth, Rs, Rp or None if the grid can't be used
+'''
+def module_params(panel_name, G, T):
+    if not _enabled:
+        return None
+    try:
+        values = lookup(panel_name, G, T)
+    except Exception as e:
+        print(f'No parameter grid for {panel_name}: {e}')
+        return None
+    if values is None:
+        return None
+    return values['Iph'], values['Is'], values['nNsVth'], values['Rs'], values['Rp']
+
+'''
+@func per cell parameters in the order _get_cell_conditions returns them
+@params panel name, irradiance and cell temperature
+@output Iph, Is, nVth, Rs, Rp per cell or None if the grid can't be used
+'''
+def cell_params(panel_name, G, T):
+    values = module_params(panel_name, G, T)
+    if values is None:
+        return None
+    Iph, Is, nNsVth, Rs, Rp = values
+    Ns = get_grid(panel_name)[1]
+    return Iph, Is, nNsVth / Ns, Rs / Ns, Rp * Ns
+
+'''
+@func builds (or maps from disk) the cell voltage volume of a panel, the voltage over
+    current fraction x irradiance x temperature, the current axis is a fraction of the
+    photocurrent at each node so the knee of every curve sits in the same place
+@params the panel name
+@output read only memory mapped array (len(G), len(T), len(fractions))
+'''
+def get_voltage_table(panel_name):
+    volume = _volumes.get(panel_name)
+    if volume is not None:
+        return volume
+
+    path = _volume_path(panel_name)
+    if not os.path.exists(path):
+        from pvlib import pvsystem
+
+        #the grid nodes already hold the exact parameters
+        table, Ns = get_grid(panel_name)
+        nodes = np.array([_from_interp(row) for row in table.reshape(-1, len(_fields))]).reshape(table.shape)
+        Iph, Is, nNsVth, Rs, Rp = (nodes[..., f][..., None] for f in range(5))
+
+        with np.errstate(all='ignore'):
+            volume = pvsystem.v_from_i(
+                current=Iph * _fractions,
+                photocurrent=Iph,
+                saturation_current=Is,
+                resistance_series=Rs / Ns,
+                resistance_shunt=Rp * Ns,
+                nNsVth=nNsVth / Ns
+            )
+
+        try:
+            os.makedirs(_grid_dir, exist_ok=True)
+            tmp_path = f'{path}.tmp.npy'
+            np.save(tmp_path, np.asarray(volume, dtype=float))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f'Failed to save voltage table {path} due to {e}')
+            return None
+
+    #every process maps the same file so the pages are shared
+    volume = np.load(path, mmap_mode='r')
+    with _lock:
+        _volumes[panel_name] = volume
+    return volume
+
+'''
+@func trilinear lookup of the cell voltage at a current, irradiance and temperature
+@params panel name, irradiance, cell temperature and current
+@output the cell voltage (-0.7 where pvlib has no solution like _get_voltage_from_current),
+    None if the point is off the table or the table can't be used
+    below the first irradiance step (1 W/m2) the voltage falls to 0 at G=0 faster than
+    a straight line can follow, so those points go to pvlib as well
+'''
+def cell_voltage(panel_name, G, T, I):
+    if not _enabled or not (_g_min <= G <= _g_max and _t_min <= T <= _t_max):
+        return None
+    try:
+        table, Ns = get_grid(panel_name)
+        volume = get_voltage_table(panel_name)
+    except Exception as e:
+        print(f'No voltage table for {panel_name}: {e}')
+        return None
+    if volume is None:
+        return None
+
+    i, dx, j, dy = _position(G, T)
+
+    #Iph is linear in G and T so the bilinear value is exact
+    Iph = ((table[i, j, 0] * (1 - dx) + table[i + 1, j, 0] * dx) * (1 - dy)
+        + (table[i, j + 1, 0] * (1 - dx) + table[i + 1, j + 1, 0] * dx) * dy)
+    if Iph <= 0:
+        return None
+    u = I / Iph
+    if not _fraction_list[0] <= u <= _fraction_list[-1]:
+        return None
+    k = min(bisect.bisect_right(_fraction_list, u) - 1, len(_fraction_list) - 2)
+    dz = (u - _fraction_list[k]) / (_fraction_list[k + 1] - _fraction_list[k])
+
+    corners = volume[i:i + 2, j:j + 2, k:k + 2]
+    corners = corners[:, :, 0] * (1 - dz) + corners[:, :, 1] * dz
+    corners = corners[:, 0] * (1 - dy) + corners[:, 1] * dy
+    voltage = float(corners[0] * (1 - dx) + corners[1] * dx)
+
+    if math.isnan(voltage):
+        return -0.7
+    return voltage
+
+#drops a panel's grid and voltage table after its parameters change
+def invalidate(panel_name):
+    with _lock:
+        _grids.pop(panel_name, None)
+        _volumes.pop(panel_name, None)
+    for path in (_grid_path(panel_name), _volume_path(panel_name)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+'''
+@func checks the interpolated lookup against the exact pvlib result at random points
+@params panel name, number of points and the allowed relative error
+@output True if every field is inside the tolerance, prints the results like regression_testing
+    run as a module it exits non zero when any field is over the tolerance
+'''
+def grid_check(panel_name, samples=500, tolerance=0.01):
+    import time
+
+    rng = np.random.default_rng(0)
+    #log uniform down to the bottom of the grid, so the dim steps are checked as often as the bright ones
+    G = np.exp(rng.uniform(math.log(_g_min), math.log(_g_max), samples))
+    T = rng.uniform(_temps[0], _temps[-1], samples)
+
+    params, Ns = _desoto_params(panel_name)
+    exact = _exact(params, G, T)
+
+    get_grid(panel_name)
+    start = time.perf_counter()
+    approx = [lookup(panel_name, g, t) for g, t in zip(G, T)]
+    per_lookup = (time.perf_counter() - start) / samples
+    approx = np.array([[values[f] for f in _fields] for values in approx])
+
+    errors = np.max(np.abs(approx - exact) / np.abs(exact), axis=0)
+
+    print(f"Test 1 - interpolated grid against pvlib for {panel_name}")
+    for field, error in zip(_fields, errors):
+        print(f"{field}: max relative error {error:.2e} - {'PASS' if error <= tolerance else 'FAIL'}")
+    print()
+
+    print("Test 2 - lookup time")
+    print(f"{per_lookup * 1e6:.1f} microseconds per lookup")
+    print()
+
+    #voltages up to the photocurrent, relative to the exact voltage, or to a tenth of the
+    #cell voc where the curve crosses zero near the short circuit
+    from pvlib import pvsystem
+    fractions = rng.uniform(0, 1, samples)
+    Iph, Is, Rs, Rp, nNsVth = (np.asarray(a) for a in _desoto(params, G, T))
+    exact_v = pvsystem.v_from_i(current=Iph * fractions, photocurrent=Iph, saturation_current=Is,
+        resistance_series=Rs / Ns, resistance_shunt=Rp * Ns, nNsVth=nNsVth / Ns)
+    voc = exact[:, 8] / Ns
+
+    get_voltage_table(panel_name)
+    start = time.perf_counter()
+    approx_v = np.array([cell_voltage(panel_name, g, t, i) for g, t, i in zip(G, T, Iph * fractions)])
+    per_voltage = (time.perf_counter() - start) / samples
+    voltage_error = float(np.max(np.abs(approx_v - exact_v) / np.maximum(np.abs(exact_v), 0.1 * voc)))
+
+    print("Test 3 - interpolated cell voltage against v_from_i")
+    print(f"max relative error {voltage_error:.2e}, {per_voltage * 1e6:.1f} microseconds per lookup - {'PASS' if voltage_error <= tolerance else 'FAIL'}")
+    print()
+
+    return bool(np.all(errors <= tolerance)) and voltage_error <= tolerance
+
+#checks a panel against pvlib, or builds the grids and voltage tables ahead of time
+#python -m flaskr.param_grid <panel name> [tolerance]
+#python -m flaskr.param_grid --build <panel name> [<panel name> ...]
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or (sys.argv[1] == '--build' and len(sys.argv) < 3):
+        print("Usage: python -m flaskr.param_grid <panel name> [tolerance]")
+        print("       python -m flaskr.param_grid --build <panel name> [<panel name> ...]")
+        sys.exit(2)
+    else:
+        from flaskr import create_app
+        app = create_app()
+        with app.app_context():
+            if sys.argv[1] == '--build':
+                for panel_name in sys.argv[2:]:
+                    get_voltage_table(panel_name)
+                    print(f'Built {_grid_path(panel_name)} and {_volume_path(panel_name)}')
+            else:
+                tolerance = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+                if not grid_check(sys.argv[1], tolerance=tolerance):
+                    sys.exit(f'Grid check failed: a field of {sys.argv[1]} is over the {tolerance} tolerance')
@@ -1,12 +1,32 @@
 from run import create_app  
 import flaskr.refactored_helper as hp
+import flaskr.helper_functions as hf
 from flaskr.refactored_classes import String
 from flaskr.models import PanelInfo
+import flaskr.surrogate as sg
+import flaskr.param_grid as pg
+import flaskr.inverter as inv
 from datetime import datetime, timedelta
 import copy
 import pandas as pd
 from zoneinfo import ZoneInfo
 import os
+
+#an unshaded string is every panel at its max power point, so it's exact from the parameter grid
+#Pmax, Vmp, Imp or None off the grid
+def _unshaded_power(panel_name, irr, temp, num_panels, voltage_offset=None):
+    values = pg.lookup(panel_name, irr, temp)
+    if values is None:
+        return None
+
+    Pmax = num_panels * values['Pmax']
+    Vmp = num_panels * values['Vmp']
+    Imp = values['Imp']
+    if voltage_offset is not None:
+        Pmax *= voltage_offset
+        Vmp *= voltage_offset
+    return Pmax, Vmp, Imp
+
 '''
 @func this is where the power over time happens, so needs to take the time tested, the shadow data,
     and the string information, and use the _model_power function to find the max power at each time
@@ -23,14 +43,22 @@ import os
     - the name of the pixel file (file needs to be saved in flaskr/static/tmp)
     - the root path of the app
     - added site_name to save csv information
-@outputs - a csv file with the vmp, imp and pmax at each time
+    - fast, predicts the shaded power with the trained surrogate and reads the unshaded power
+        from the parameter grid instead of the full model (no per panel csvs, the error bound is
+        printed at the start), needs python -m flaskr.surrogate run for the panel first
+    - the inverter name (optional), its model ('sandia' or 'pvwatts') and the number of
+        parallel strings feeding it, adds the ac power and energy of each step
+    - the weather, 'clearsky' for the clear sky model or 'pvgis' for the hourly pvgis data in the
+        weather store interpolated to the timestep, read a month at a time for long ranges
+@outputs - a csv file with the vmp, imp and pmax at each time (and the ac columns with an inverter)
     - a log file with each active bypass diode
     - graphs of power over time
 '''
 def _model_power_time(root_path, coords=(0,0), panel_name='Jinko_Solar_Co___Ltd_JKM410M_72HL_V', num_panels=28,
         rotation=90, voltage_offset=None, timestep_unit='hours', timestep_integer=1, start_date=datetime.now(), 
         end_date=datetime.now()+timedelta(days=1), pixel_file="_shadow_events_average_power_blocked.csv", lat=0, lon=0,
-        site_name='Windmill'):
+        site_name='Windmill', fast=False, inverter_name=None, inverter_model='sandia', num_strings=1,
+        weather='clearsky'):
 
     # Create the full path inside csv_outputs
     root_csv_dir = "csv_outputs"
@@ -53,6 +81,16 @@ def _model_power_time(root_path, coords=(0,0), panel_name='Jinko_Solar_Co___Ltd_
     ).first()
     noct = record.noct
 
+    #load the surrogate once for the whole run, without a trained one the full model is used
+    model = None
+    if fast:
+        model = sg.get_model(panel_name)
+        if model is None:
+            print(f'No surrogate trained for {panel_name}, using the full model '
+                f'(train it with python -m flaskr.surrogate "{panel_name}")')
+        else:
+            print(f'Fast mode: {sg.describe_error(model)}')
+
     #create an empty dataframe to hold the output (one for shaded one for unshaded)
     df_shade = pd.DataFrame(columns=["time_str", "pmax", "vmp", "imp"])
     df_unshade = pd.DataFrame(columns=["time_str", "pmax", "vmp", "imp"])
@@ -67,8 +105,18 @@ def _model_power_time(root_path, coords=(0,0), panel_name='Jinko_Solar_Co___Ltd_
     timezone = ZoneInfo(hp._get_timezone(lat, lon))
     timestep = timedelta(**{timestep_unit: timestep_integer})
 
-    #get weather conditons
-    dni_df = hp._get_irr(start_date, end_date, lat, lon, timestep_integer, t_unit, timezone)
+    #convert times to the correct timezone
+    time = start_date.replace(tzinfo=timezone)
+    end = end_date.replace(tzinfo=timezone)
+
+    #get weather conditons, the clear sky frame covers the whole range, pvgis comes a month at a time
+    if weather == 'pvgis':
+        weather_chunks = hf.iter_weather(lat, lon, time, end, timestep)
+    elif weather == 'clearsky':
+        weather_chunks = iter([hp._get_irr(start_date, end_date, lat, lon, timestep_integer, t_unit, timezone)])
+    else:
+        raise ValueError(f"Unknown weather '{weather}', use 'clearsky' or 'pvgis'")
+    dni_df = next(weather_chunks)
 
     #create the dictionaries needed (pixels from file and panel)
     pixel_file_path = os.path.join(root_path, 'static', 'tmp', pixel_file)
@@ -76,15 +124,13 @@ def _model_power_time(root_path, coords=(0,0), panel_name='Jinko_Solar_Co___Ltd_
         pixel_dict = hp._file_pixel_dict(pixel_file, start_date, end_date, timestep)
     panel_dict = hp._calculate_pixels(_string_instance)
 
-    #convert times to the correct timezone
-    time = start_date.replace(tzinfo=timezone)
-    end = end_date.replace(tzinfo=timezone)
-
     #iterates through each time
     while time <= end:
         time_str = time.strftime("%d:%H:%M")
 
-        #gets the weather conditions at that time
+        #gets the weather conditions at that time, moving to the next month once this one is done
+        if time > dni_df.index[-1]:
+            dni_df = next(weather_chunks)
         row = dni_df.loc[time]
         irr = row['irr']
         temp = row['temp']
@@ -110,9 +156,23 @@ def _model_power_time(root_path, coords=(0,0), panel_name='Jinko_Solar_Co___Ltd_
             time += timestep
             continue
 
-        #if not model the time of both shaded and unshaded
-        Pmax, Vmp, Imp = _string_instance._model_power((shaded_irr, shaded_cell_temp), (irr, unshaded_cell_temp), time_str, site_name=site_name, output_csv=True)
-        Pmax2, Vmp2, Imp2 = _string_copy._model_power((shaded_irr, shaded_cell_temp), (irr, unshaded_cell_temp), time_str)
+        #when fast the shaded string is predicted from the module shade and the unshaded one read
+        #from the grid, the full model is kept for points off the grid
+        fast_results = None
+        if model is not None:
+            fractions = _string_instance._module_shade_fractions()
+            shaded_results = sg.predict(model, panel_name, (shaded_irr, shaded_cell_temp), (irr, unshaded_cell_temp),
+                fractions, num_panels, voltage_offset)
+            unshaded_results = _unshaded_power(panel_name, irr, unshaded_cell_temp, num_panels, voltage_offset)
+            if shaded_results is not None and unshaded_results is not None:
+                fast_results = shaded_results, unshaded_results
+
+        if fast_results is not None:
+            (Pmax, Vmp, Imp), (Pmax2, Vmp2, Imp2) = fast_results
+        else:
+            #if not model the time of both shaded and unshaded
+            Pmax, Vmp, Imp = _string_instance._model_power((shaded_irr, shaded_cell_temp), (irr, unshaded_cell_temp), time_str, site_name=site_name, output_csv=True)
+            Pmax2, Vmp2, Imp2 = _string_copy._model_power((shaded_irr, shaded_cell_temp), (irr, unshaded_cell_temp), time_str)
 
         #then add to df
         df_unshade.loc[len(df_unshade)] = [time_str, Pmax2, Vmp2, Imp2]
@@ -122,6 +182,14 @@ def _model_power_time(root_path, coords=(0,0), panel_name='Jinko_Solar_Co___Ltd_
 
         time += timestep
     
+    #the inverter runs over the whole series at once
+    if inverter_name is not None:
+        df_shade = inv.inverter_stage(df_shade, inverter_name, timestep, inverter_model, num_strings)
+        df_unshade = inv.inverter_stage(df_unshade, inverter_name, timestep, inverter_model, num_strings)
+        print(f"AC energy {df_shade['ac_energy'].sum() / 1000:.2f} kWh shaded, "
+            f"{df_unshade['ac_energy'].sum() / 1000:.2f} kWh unshaded, "
+            f"{df_shade['tare_energy'].sum() / 1000:.3f} kWh drawn at night")
+
     #finally convert to csv and output
     df_shade.to_csv("shaded_output.csv", index=False)
     df_unshade.to_csv("unshaded_output.csv", index=False)
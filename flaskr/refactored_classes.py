@@ -4,6 +4,7 @@ from flaskr.simple_calc import _get_bypass_current, _calculate_voltage, _get_cur
 import os
 import pandas as pd
 import flaskr.refactored_helper as hp
+import flaskr.param_grid as pg
 '''
 @class simplified version of the cell class
     want to hold whether the cell is shaded/not shaded
@@ -11,6 +12,8 @@ import flaskr.refactored_helper as hp
         - set_shade()
 '''
 class Cell():
+    __slots__ = ('shaded', 'parent')
+
     def __init__(self):
         self.shaded = False
         self.parent = None
@@ -141,11 +144,17 @@ class String():
             0, self.unshaded_params)
 
     #given a current calculate the shade/unshaded voltages
+    #reads the precomputed voltage table, pvlib is only used for points off the table
     def _calc_voltages(self, I):
-        shaded_voltage = _get_voltage_from_current(self.panel_name, self.shaded_conditions[0], self.shaded_conditions[1],
-            I, self.shaded_params)
-        unshaded_voltage = _get_voltage_from_current(self.panel_name, self.unshaded_conditions[0], self.unshaded_conditions[1],
-            I, self.unshaded_params)
+        voltages = []
+        for (G, T), params in ((self.shaded_conditions, self.shaded_params),
+                (self.unshaded_conditions, self.unshaded_params)):
+            voltage = pg.cell_voltage(self.panel_name, G, T, I)
+            if voltage is None:
+                voltage = _get_voltage_from_current(self.panel_name, G, T, I, params)
+            voltages.append(voltage)
+
+        shaded_voltage, unshaded_voltage = voltages
         return shaded_voltage, unshaded_voltage
 
     #get the sum voltage of all panels
@@ -240,6 +249,11 @@ class String():
     def all_cells(self):
         return [cell for panel in self.panel_list for cell in panel._all_cells()]
 
+    #shaded share of the cells in each module, in string order
+    def _module_shade_fractions(self):
+        return [sum(cell.shaded for cell in module.cell_list) / len(module.cell_list)
+            for panel in self.panel_list for module in panel.module_list]
+
     #resets all shade to unshaded
     def reset_shade(self):
         for cell in self.all_cells():
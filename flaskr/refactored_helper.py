@@ -1,13 +1,13 @@
-import matplotlib.pyplot as plt
+import os
+import io
 import pandas as pd
-import pvlib
-from pvlib.location import Location
-from pvlib.ivtools.sdm import fit_cec_sam
-from pvlib.pvsystem import calcparams_cec, singlediode
 from datetime import datetime, timedelta
-import requests
+from collections import OrderedDict
+from functools import lru_cache
+import threading
+import hashlib
+import flaskr.climatology as climatology
 import numpy as np
-from timezonefinder import TimezoneFinder
 
 '''
 @func draws and saves graphs for power against voltage/current and IV curve
@@ -16,6 +16,8 @@ from timezonefinder import TimezoneFinder
 @output the path to the plots
 '''
 def _draw_graph(powers, voltages, currents, type, panel_name):
+    import matplotlib.pyplot as plt
+
     output_dir = f'flaskr/static/plots/{panel_name}'
     os.makedirs(output_dir, exist_ok=True)
 
@@ -80,6 +82,57 @@ def _round_sf(x, sig=3):
     from math import log10, floor
     return round(x, sig - int(floor(log10(abs(x)))) - 1)
 
+'''
+@func picks the indices of a series to keep using largest triangle three buckets
+    keeps the visual shape of long runs while bounding the points sent to the browser
+@params the x and y values and the number of points to keep
+@output a numpy array of the indices kept (all indices if already short enough)
+'''
+def _lttb_indices(x, y, threshold):
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    n = len(y)
+
+    #nothing to downsample
+    if threshold is None or threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    #size of each bucket, first and last points always kept
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    a = 0
+
+    for i in range(threshold - 2):
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+
+        #average of the next bucket is the third point of the triangle
+        next_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        #keep the point making the largest triangle
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    indices[-1] = n - 1
+    return indices
+
+'''
+@func packs a set of equal length series into little endian float32 bytes
+    each series is stored one after the other in the order given
+@params a dictionary of name to list of values
+@output the bytes, the names in order and the length of each series
+'''
+def _series_to_bytes(series):
+    names = list(series.keys())
+    length = len(series[names[0]]) if names else 0
+    arr = np.asarray([series[name] for name in names], dtype='<f4')
+    return arr.tobytes(), names, length
+
 '''
 @func calculate the locations of the pixels in the string given the top left coordinate of the string 
     assuming 6 cells per row
@@ -166,6 +219,36 @@ def _key_to_pixel(key):
     except Exception as e:
         print(f'Exception key is {key}\n')
 
+'''
+@func converts the pixel dictionary keys into coordinate arrays in one go
+@params the dictionary from _calculate_pixels (keys are 'x,y')
+@output integer numpy arrays of the x and y pixel positions
+'''
+def _pixel_coords(pixel_dict):
+    if not pixel_dict:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    coords = np.array([key.split(',') for key in pixel_dict], dtype=float).astype(int)
+    return coords[:, 0], coords[:, 1]
+
+'''
+@func draws the cell pixels onto a copy of the base image and encodes it as a png
+@params the base image as a (height, width, 3) uint8 array, the x/y arrays and the colour
+@output the png bytes
+'''
+def _draw_overlay(base, xs, ys, colour=(0, 0, 255)):
+    from PIL import Image
+
+    img = base.copy()
+    height, width = img.shape[:2]
+
+    #drop anything off the image then set every pixel at once
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    img[ys[inside], xs[inside]] = colour
+
+    buffer = io.BytesIO()
+    Image.fromarray(img).save(buffer, format='PNG')
+    return buffer.getvalue()
+
 '''
 @func takes the file, and converts it to a dictionary of times to a shaded pixel list
 @param the filename, start/end date and the timestep
@@ -198,58 +281,32 @@ def _file_pixel_dict(filename, start_date, end_date, timestep):
     return pixel_dict
 
 '''
-@func uses the nasa api to request the monthly high and low temperature of a month
+@func finds the monthly high and low temperature from the local nasa power cache
+    never waits on the network, a location not yet cached gets the default
 @param the month to test, the longitude and the latitude
 @output the high and low for that month at that location
 '''   
 def _get_avg_temp(lat, lon, month):
-    start_year = 2019
-    end_year = 2020
-
-    #use nasa power parameters
-    #t2m_max is max and t2m_min min
-    params = ["T2M_MAX", "T2M_MIN"]
-
-    #the api url to request data from
-    url = (
-        f"https://power.larc.nasa.gov/api/temporal/monthly/point"
-        f"?parameters={','.join(params)}"
-        f"&community=AG"
-        f"&longitude={lon}&latitude={lat}"
-        f"&start={start_year}&end={end_year}"
-        f"&format=JSON"
-    )
-    response = requests.get(url)
-    data = response.json()
-
-    records = []
-    for date_str, values in data['properties']['parameter']['T2M_MAX'].items():
-        records.append({
-            'YearMonth': date_str,
-            'Tmax': values,
-            'Tmin': data['properties']['parameter']['T2M_MIN'][date_str]
-        })
+    return climatology.monthly_temps(lat, lon, month)
 
-    #filter the records to the correct month
-    filtered_records = []
-    for record in records:
-        if record['YearMonth'] == f'2019{month}':
-            filtered_records.append(record)
+#solar geometry frames by site and period, least recently used dropped first
+_irr_cache = OrderedDict()
+_irr_cache_lock = threading.Lock()
+_irr_cache_size = 32
 
-    #get the high and low 
-    t_high = record['Tmax']
-    t_low = record['Tmin']
-    return t_high, t_low
+#optional parquet tier, set SOLAR_IRR_CACHE_DIR to keep frames between runs (needs pyarrow)
+_irr_cache_dir = os.environ.get('SOLAR_IRR_CACHE_DIR')
 
 '''
-@func uses the pvlib, to find the irradiance for the given location
-    matches this with a sin curve to estimate ambient temperatures
-    assumes panel points directly at sun
-@params the start/end date, long/lat coordinates the timstep and the timezone
-@output dataframe object, holding the ambient temp and global irradiance
+@func works out the clearsky plane of array irradiance for a site and period
+    this is the slow solar position work, the result only depends on the arguments
+@params the lat/lon coordinates, the timezone, the start/end date and the timestep
+@output dataframe of the irradiance ('irr') and shaded irradiance ('shaded_irr')
 '''
-def _get_irr(start_date, end_date, lat, lon, timestep, 
-        timestep_unit, timezone):
+def _solar_irr(lat, lon, timezone, start_date, end_date, timestep, timestep_unit):
+    import pvlib
+    from pvlib.location import Location
+
     #define the location
     site = Location(lat, lon, tz=timezone)
 
@@ -298,9 +355,97 @@ def _get_irr(start_date, end_date, lat, lon, timestep,
         albedo=0.2
     )
 
+    return pd.DataFrame({
+        'irr': poa['poa_global'],
+        'shaded_irr': shaded_poa['poa_global']
+    }, index=times)
+
+#parquet file for a cache key
+def _irr_cache_path(key):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(_irr_cache_dir, f'{digest}.parquet')
+
+'''
+@func returns the solar irradiance frame for a site and period from the memory lru,
+    then the parquet tier, only computing it on a miss
+@params the same as _solar_irr
+@output a copy of the irradiance dataframe (callers can change it freely)
+'''
+def _cached_solar_irr(lat, lon, timezone, start_date, end_date, timestep, timestep_unit):
+    key = (round(float(lat), 6), round(float(lon), 6), str(timezone),
+        str(start_date), str(end_date), int(timestep), timestep_unit)
+
+    with _irr_cache_lock:
+        df = _irr_cache.get(key)
+        if df is not None:
+            _irr_cache.move_to_end(key)
+            return df.copy()
+
+    df = None
+    if _irr_cache_dir:
+        path = _irr_cache_path(key)
+        if os.path.exists(path):
+            try:
+                df = pd.read_parquet(path)
+            except Exception as e:
+                print(f'Failed to read irradiance cache {path} due to {e}')
+
+    if df is None:
+        df = _solar_irr(lat, lon, timezone, start_date, end_date, timestep, timestep_unit)
+        if _irr_cache_dir:
+            try:
+                os.makedirs(_irr_cache_dir, exist_ok=True)
+                df.to_parquet(_irr_cache_path(key))
+            except Exception as e:
+                print(f'Failed to write irradiance cache due to {e}')
+
+    with _irr_cache_lock:
+        _irr_cache[key] = df
+        _irr_cache.move_to_end(key)
+        while len(_irr_cache) > _irr_cache_size:
+            _irr_cache.popitem(last=False)
+
+    return df.copy()
+
+'''
+@func finds the monthly high and low temperature at every time
+    within one month it is that month's values, across months the values are
+    interpolated between the middle of each month
+@params the (timezone aware) times and the lat/lon coordinates
+@output arrays of the high and low temperature, one per time
+'''
+def _monthly_highs_lows(times, lat, lon):
+    local = times.tz_localize(None)
+    months = pd.period_range(local[0], local[-1], freq='M')
+
+    highs = []
+    lows = []
+    for month in months:
+        t_high, t_low = _get_avg_temp(lat, lon, month.strftime('%m'))
+        highs.append(t_high)
+        lows.append(t_low)
+
+    if len(months) == 1:
+        return np.full(len(times), highs[0], dtype=float), np.full(len(times), lows[0], dtype=float)
+
+    #the monthly values are centred on the middle of the month, positions in seconds from the start
+    mid_months = np.array([((m.start_time + (m.end_time - m.start_time) / 2) - local[0]).total_seconds()
+        for m in months])
+    positions = np.asarray((local - local[0]).total_seconds(), dtype=float)
+    return np.interp(positions, mid_months, highs), np.interp(positions, mid_months, lows)
+
+'''
+@func builds the synthetic ambient temperature curve, a sin wave between the monthly
+    low at 3am and high at 3pm, worked out for every time at once
+@params the (timezone aware) times and the lat/lon coordinates
+@output series of the ambient temperature indexed by time
+'''
+def _ambient_temps(times, lat, lon):
+    if len(times) == 0:
+        return pd.Series([], index=times, dtype=float)
+
     #get the high and low temperature 
-    month = start_date.strftime('%m')
-    t_high, t_low = _get_avg_temp(lat, lon, month)
+    t_high, t_low = _monthly_highs_lows(times, lat, lon)
 
     #get the mean and difference from mean (amplitude)
     t_avg = (t_high + t_low)/2
@@ -308,22 +453,32 @@ def _get_irr(start_date, end_date, lat, lon, timestep,
 
     #assume min temp at 3am and max at 3pm
     time_low = 3
-    temps = []
 
-    for time in times:
-        #get the hour of the day
-        hour = time.hour + time.minute/60
+    #get the hour of the day
+    hour = np.asarray(times.hour + times.minute/60, dtype=float)
 
-        #take the averaga and sin curve deviation to get a synethic time curve
-        angle = ((hour-time_low)/24) * 2 * np.pi - (np.pi/2) #shift by -pi/2
-        temp = t_avg + amp * np.sin(angle)
-        temps.append(temp)
+    #take the average and sin curve deviation to get a synthetic time curve
+    angle = ((hour-time_low)/24) * 2 * np.pi - (np.pi/2) #shift by -pi/2
+    return pd.Series(t_avg + amp * np.sin(angle), index=times)
 
-    ambient_temp = pd.Series(temps, index=times)
+'''
+@func uses the pvlib, to find the irradiance for the given location
+    matches this with a sin curve to estimate ambient temperatures
+    assumes panel points directly at sun
+    the irradiance is memoized by site and period, see _cached_solar_irr
+@params the start/end date, long/lat coordinates the timstep and the timezone
+@output dataframe object, holding the ambient temp and global irradiance
+'''
+def _get_irr(start_date, end_date, lat, lon, timestep, 
+        timestep_unit, timezone):
+    irr_df = _cached_solar_irr(lat, lon, timezone, start_date, end_date, timestep, timestep_unit)
+    times = irr_df.index
+
+    ambient_temp = _ambient_temps(times, lat, lon)
     df = pd.DataFrame({
-        'irr': poa['poa_global'],
+        'irr': irr_df['irr'],
         'temp': ambient_temp,
-        'shaded_irr': shaded_poa['poa_global']
+        'shaded_irr': irr_df['shaded_irr']
     }, index=times)
 
     return df
@@ -370,23 +525,43 @@ def _khw_output(timestep, powers):
 
     return total
 
+#one finder for the whole process, made on first use
+_tz_finder = None
+_tz_finder_lock = threading.Lock()
+
+#returns the shared finder, polygon data held in memory
+def _get_tz_finder():
+    global _tz_finder
+    if _tz_finder is None:
+        with _tz_finder_lock:
+            if _tz_finder is None:
+                from timezonefinder import TimezoneFinder
+                _tz_finder = TimezoneFinder(in_memory=True)
+    return _tz_finder
+
+#memoized lookup, coordinates are rounded by the caller so nearby sites share an entry
+@lru_cache(maxsize=4096)
+def _timezone_at(lat, lon):
+    return _get_tz_finder().timezone_at(lat=lat, lng=lon)
+
 '''
 @func uses the coordinates of the spot to find the correct time
+    coordinates are rounded to 4 decimal places (about 10m) for the cache
 @params lat/lon coordinates
 @output the timezone as a string
 '''
 def _get_timezone(lat, lon):
-    tf = TimezoneFinder()
-    timezone_str = tf.timezone_at(lat=lat, lng=lon)
-    return timezone_str
+    return _timezone_at(round(float(lat), 4), round(float(lon), 4))
 
 '''
 @func stores the series of variables needed for the single diode model in the custom panel table
     means that the user can build a custom panel 
 @params need voc, isc, vmp, number of cells, alpha_sc, the type of cell, the gamma_pmp, beta_voc
-@returns I_L_ref, I_o_ref, R_s, R_sh_ref, a_ref, alpha_sc
+@returns I_L_ref, I_o_ref, R_s, R_sh_ref, a_ref, alpha_sc (None if the fit fails)
 '''
 def _custom_panel_extraction(Voc, Isc, Vmp, Imp, N_cells, alpha_sc, gamma_pmp, beta_voc, cell_type,):
+    from pvlib.ivtools.sdm import fit_cec_sam
+
     #constants
     k = 1.380649e-23  # Boltzmann constant (J/K)
     q = 1.602176634e-19  # Elementary charge (C)
@@ -416,7 +591,7 @@ def _custom_panel_extraction(Voc, Isc, Vmp, Imp, N_cells, alpha_sc, gamma_pmp, b
         return I_L_ref, I_o_ref, R_s, R_sh_ref, a_ref, alpha_sc_A_per_C
     except Exception as e:
         print(f"Failed parameter extraction: {e}")
-        return (0,) * 5
+        return None
 
 '''
 @func a simple way using the single diode model to calculate the max power of a panel
@@ -425,6 +600,8 @@ def _custom_panel_extraction(Voc, Isc, Vmp, Imp, N_cells, alpha_sc, gamma_pmp, b
 '''
 def _calculate_pmp_simple(I_L_ref, I_o_ref, R_s, R_sh_ref, a_ref,
                         temp_cell=25, irradiance=1000, alpha_sc=0.006445):
+    from pvlib.pvsystem import calcparams_cec, singlediode
+
     # Calculate parameters at operating conditions
     photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth = calcparams_cec(
         effective_irradiance=irradiance,
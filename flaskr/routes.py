@@ -1,5 +1,4 @@
 from flask import Blueprint, render_template, request, session, url_for, send_from_directory
-from .models import PanelInfo
 import os
 
 bp = Blueprint('routes', __name__)
@@ -10,18 +9,12 @@ def dashboard():
 
 @bp.route('/cell')
 def cell():
-    panels = PanelInfo.query.with_entities(PanelInfo.panel_name).distinct().all()
-    panel_names = [p.panel_name for p in panels]
-    return render_template('cell_page.html', panel_names=panel_names)
+    return render_template('cell_page.html')
 
 @bp.route('/panel')
 def panel():
-    panels = PanelInfo.query.with_entities(PanelInfo.panel_name).distinct().all()
-    panel_names = [p.panel_name for p in panels]
-    return render_template('panel_page.html', panel_names=panel_names, num_rows=0)
+    return render_template('panel_page.html', num_rows=0)
 
 @bp.route('/string')
 def string():
-    panels = PanelInfo.query.with_entities(PanelInfo.panel_name).distinct().all()
-    panel_names = [p.panel_name for p in panels]
-    return render_template('string_page.html', panel_names=panel_names)
+    return render_template('string_page.html')
@@ -1,9 +1,8 @@
-import pvlib
 import numpy as np
 import math
-from pvlib import pvsystem
 from flaskr.models import CustomPanel
 from flaskr import db
+import flaskr.param_grid as pg
 
 '''
 @func need to use the pvlib to get the features of a module needed for calculation 
@@ -13,6 +12,13 @@ from flaskr import db
 @output Iph, Isat, Rs, Rp, nNsVth
 '''
 def _get_cell_conditions(panel_name, G, T):
+    #interpolate from the precomputed grid when (G, T) is on it
+    values = pg.cell_params(panel_name, G, T)
+    if values is not None:
+        return values
+
+    import pvlib
+
     #get the module from the library
     cec_modules = pvlib.pvsystem.retrieve_sam('CECMod')
     try:
@@ -83,6 +89,8 @@ def _get_cell_conditions(panel_name, G, T):
 @output the voltage of the cell
 '''
 def _get_voltage_from_current(panel_name, G, T, I, values=None):
+    from pvlib import pvsystem
+
     try:
         if values is None:
             Iph_cell, Is_cell, nVth_cell, Rs_cell, Rp_cell = _get_cell_conditions(panel_name, G, T)
@@ -115,6 +123,8 @@ def _get_voltage_from_current(panel_name, G, T, I, values=None):
 @output the current of the cell
 '''
 def _get_current_from_voltage(panel_name, G, T, V, values):
+    from pvlib import pvsystem
+
     try:
         #get the cell conditions
         Iph_cell, Is_cell, nVth_cell, Rs_cell, Rp_cell = values
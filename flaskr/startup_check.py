@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+
+#modules that should only load on first use, never while the app starts
+_lazy_modules = ['pvlib', 'matplotlib', 'scipy', 'PIL', 'psutil', 'memory_profiler',
+    'tracemalloc', 'timezonefinder', 'requests']
+
+#run in a fresh interpreter so nothing is already imported
+_probe = '''
+import sys, time, json
+start = time.perf_counter()
+from flaskr import create_app
+create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+'''
+
+'''
+@func checks create_app starts inside the time budget without loading heavy modules
+@params the budget in seconds and the number of runs (the fastest is used)
+@output True if both checks pass, prints the results like regression_testing
+    run as a module it exits non zero on a failure so ci can gate on it
+'''
+def startup_check(budget=2.0, runs=3):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', _probe % _lazy_modules],
+            capture_output=True, text=True, check=True).stdout
+        #other startup output can be printed around the result
+        line = next(l for l in output.splitlines() if l.startswith('{'))
+        results.append(json.loads(line))
+
+    fastest = min(result['elapsed'] for result in results)
+    loaded = sorted({m for result in results for m in result['loaded']})
+
+    print("Test 1 - create_app startup time")
+    print(f"fastest of {runs} runs is {fastest:.2f}s, budget is {budget:.2f}s - {'PASS' if fastest <= budget else 'FAIL'}")
+    print()
+
+    print("Test 2 - heavy modules not loaded at startup")
+    print(f"loaded: {loaded or 'none'} - {'FAIL' if loaded else 'PASS'}")
+    print()
+
+    return fastest <= budget and not loaded
+
+#python -m flaskr.startup_check [budget seconds]
+if __name__ == "__main__":
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    if not startup_check(budget):
+        sys.exit('Startup check failed: create_app is over budget or loaded a heavy module')
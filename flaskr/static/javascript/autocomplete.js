@@ -0,0 +1,50 @@
+// Fills the panel name datalists from /panel_names as the user types
+// so pages don't need the whole catalogue embedded in them
+
+const AUTOCOMPLETE_DELAY = 150;
+
+async function fetchPanelNames(text, limit = 20) {
+    const params = new URLSearchParams({ q: text, limit: limit });
+    const response = await fetch(`/panel_names?${params.toString()}`);
+    const data = await response.json();
+    if (data.status !== 'success') {
+        throw new Error(data.message);
+    }
+    return data.names;
+}
+
+function attachPanelAutocomplete(input) {
+    const datalist = document.getElementById(input.getAttribute('list'));
+    if (!datalist) return;
+
+    let timer = null;
+    let latest = 0;
+
+    const update = async () => {
+        const request = ++latest;
+        try {
+            const names = await fetchPanelNames(input.value.trim());
+            // Ignore replies to older keystrokes
+            if (request !== latest) return;
+
+            datalist.innerHTML = '';
+            names.forEach(name => {
+                const option = document.createElement('option');
+                option.value = name;
+                datalist.appendChild(option);
+            });
+        } catch (error) {
+            console.error('Failed to load panel names:', error);
+        }
+    };
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(update, AUTOCOMPLETE_DELAY);
+    });
+    input.addEventListener('focus', update, { once: true });
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('input[list="panels"]').forEach(attachPanelAutocomplete);
+});
@@ -0,0 +1,192 @@
+// Lightweight canvas line charts drawn from the series endpoints
+
+const CHART_PADDING = { top: 30, right: 20, bottom: 45, left: 60 };
+
+// Min/max over every line, ignoring gaps (null/NaN)
+function seriesRange(values) {
+    let min = Infinity;
+    let max = -Infinity;
+    values.forEach(v => {
+        if (v === null || Number.isNaN(v)) return;
+        if (v < min) min = v;
+        if (v > max) max = v;
+    });
+    if (min === Infinity) return [0, 1];
+    if (min === max) return [min - 1, max + 1];
+    return [min, max];
+}
+
+// Draws one or more lines on a canvas
+// lines: [{ x: [...], y: [...], label: '', color: '' }]
+// options: { title, xLabel, yLabel, xTickFormat: x => label }
+function drawLineChart(canvas, lines, options = {}) {
+    const ctx = canvas.getContext('2d');
+    const width = canvas.width;
+    const height = canvas.height;
+    const plotW = width - CHART_PADDING.left - CHART_PADDING.right;
+    const plotH = height - CHART_PADDING.top - CHART_PADDING.bottom;
+
+    const [xMin, xMax] = seriesRange(lines.flatMap(line => line.x));
+    const [yMin, yMax] = seriesRange(lines.flatMap(line => line.y));
+    const toX = x => CHART_PADDING.left + ((x - xMin) / (xMax - xMin)) * plotW;
+    const toY = y => CHART_PADDING.top + plotH - ((y - yMin) / (yMax - yMin)) * plotH;
+
+    ctx.clearRect(0, 0, width, height);
+    ctx.fillStyle = '#ffffff';
+    ctx.fillRect(0, 0, width, height);
+
+    // Grid and axis labels
+    ctx.strokeStyle = '#e2e8f0';
+    ctx.fillStyle = '#64748b';
+    ctx.font = '11px sans-serif';
+    ctx.lineWidth = 1;
+    for (let i = 0; i <= 5; i++) {
+        const yVal = yMin + ((yMax - yMin) * i) / 5;
+        const y = toY(yVal);
+        ctx.beginPath();
+        ctx.moveTo(CHART_PADDING.left, y);
+        ctx.lineTo(width - CHART_PADDING.right, y);
+        ctx.stroke();
+        ctx.textAlign = 'right';
+        ctx.fillText(Number(yVal.toPrecision(3)), CHART_PADDING.left - 6, y + 4);
+
+        const xVal = xMin + ((xMax - xMin) * i) / 5;
+        const x = toX(xVal);
+        ctx.textAlign = 'center';
+        const xText = options.xTickFormat ? options.xTickFormat(xVal) : Number(xVal.toPrecision(3));
+        ctx.fillText(xText, x, height - CHART_PADDING.bottom + 16);
+    }
+
+    // Lines, breaking at gaps
+    lines.forEach(line => {
+        ctx.strokeStyle = line.color || '#667eea';
+        ctx.lineWidth = 2;
+        ctx.beginPath();
+        let drawing = false;
+        line.x.forEach((xVal, i) => {
+            const yVal = line.y[i];
+            if (yVal === null || Number.isNaN(yVal)) {
+                drawing = false;
+                return;
+            }
+            if (drawing) {
+                ctx.lineTo(toX(xVal), toY(yVal));
+            } else {
+                ctx.moveTo(toX(xVal), toY(yVal));
+                drawing = true;
+            }
+        });
+        ctx.stroke();
+    });
+
+    // Title, axis names and legend
+    ctx.fillStyle = '#2c3e50';
+    ctx.textAlign = 'center';
+    ctx.font = 'bold 13px sans-serif';
+    ctx.fillText(options.title || '', width / 2, 18);
+    ctx.font = '12px sans-serif';
+    ctx.fillText(options.xLabel || '', width / 2, height - 8);
+    ctx.save();
+    ctx.translate(14, height / 2);
+    ctx.rotate(-Math.PI / 2);
+    ctx.fillText(options.yLabel || '', 0, 0);
+    ctx.restore();
+
+    ctx.textAlign = 'left';
+    lines.forEach((line, i) => {
+        if (!line.label) return;
+        const y = CHART_PADDING.top + 12 + i * 16;
+        ctx.fillStyle = line.color || '#667eea';
+        ctx.fillRect(CHART_PADDING.left + 10, y - 8, 12, 3);
+        ctx.fillStyle = '#2c3e50';
+        ctx.fillText(line.label, CHART_PADDING.left + 28, y - 3);
+    });
+}
+
+// Replaces leading/trailing zeros with gaps so night time isn't drawn
+function breakZeroBlocks(values) {
+    const first = values.findIndex(v => v !== 0);
+    if (first === -1) return values.slice();
+    let last = values.length - 1;
+    while (values[last] === 0) last--;
+    return values.map((v, i) => (i < first || i > last ? null : v));
+}
+
+// Label of the sample closest to x (steps are sorted)
+function nearestLabel(steps, labels, x) {
+    let best = 0;
+    steps.forEach((s, i) => {
+        if (Math.abs(s - x) < Math.abs(steps[best] - x)) best = i;
+    });
+    return labels[best] ?? '';
+}
+
+// Creates a canvas inside a container and returns it
+function createChartCanvas(container, width = 640, height = 360) {
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    canvas.style.maxWidth = '100%';
+    container.appendChild(canvas);
+    return canvas;
+}
+
+// Fetches a cell's IV/PV/PI series and draws the three charts
+async function loadCellCharts(container) {
+    const params = new URLSearchParams({
+        panel_name: container.dataset.panelName,
+        temperature: container.dataset.temperature,
+        irradiance: container.dataset.irradiance
+    });
+
+    const response = await fetch(`/cell_series?${params.toString()}`);
+    const data = await response.json();
+    if (data.status !== 'success') {
+        container.textContent = `Failed to load graphs: ${data.message}`;
+        return;
+    }
+
+    container.innerHTML = '';
+    drawLineChart(createChartCanvas(container),
+        [{ x: data.voltage, y: data.power, label: 'Power vs Voltage', color: 'blue' }],
+        { title: 'Cell Power vs Voltage', xLabel: 'Voltage (V)', yLabel: 'Power (W)' });
+    drawLineChart(createChartCanvas(container),
+        [{ x: data.current, y: data.power, label: 'Power vs Current', color: 'green' }],
+        { title: 'Cell Power vs Current', xLabel: 'Current (A)', yLabel: 'Power (W)' });
+    drawLineChart(createChartCanvas(container),
+        [{ x: data.current, y: data.voltage, label: 'Voltage vs Current', color: 'red' }],
+        { title: 'Cell Voltage vs Current', xLabel: 'Current (A)', yLabel: 'Voltage (V)' });
+}
+
+// Fetches the power over time series and draws power/voltage/current charts
+async function loadPowerCharts(container, points = 500) {
+    const response = await fetch(`/power_series?points=${points}`);
+    const data = await response.json();
+    if (data.status !== 'success') {
+        throw new Error(data.message);
+    }
+
+    const charts = [
+        { key: 'power', title: 'Power over Time', yLabel: 'Power (kW)', colors: ['blue', 'red'] },
+        { key: 'voltage', title: 'Voltage over Time', yLabel: 'Voltages (V)', colors: ['green', 'blue'] },
+        { key: 'current', title: 'Current over Time', yLabel: 'Current (A)', colors: ['red', 'green'] }
+    ];
+
+    charts.forEach(chart => {
+        const item = document.createElement('div');
+        item.className = 'graph-item';
+        container.appendChild(item);
+
+        const shadedKey = `shaded_${chart.key}`;
+        const unshadedKey = `unshaded_${chart.key}`;
+        drawLineChart(createChartCanvas(item), [
+            { x: data.step, y: breakZeroBlocks(data[unshadedKey]), label: `Unshaded ${chart.key}`, color: chart.colors[1] },
+            { x: data.step, y: breakZeroBlocks(data[shadedKey]), label: `Shaded ${chart.key}`, color: chart.colors[0] }
+        ], {
+            title: chart.title,
+            xLabel: 'Time',
+            yLabel: chart.yLabel,
+            xTickFormat: x => nearestLabel(data.step, data.time, x)
+        });
+    });
+}
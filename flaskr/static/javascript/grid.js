@@ -54,7 +54,81 @@ function animateTableUpdate() {
     }
 }
 
-async function buildData(formData = null) {
+// Filters of the last search, reused when loading the next page
+let lastFilterData = null;
+
+function createPanelRow(tbody, panel, index) {
+    const row = document.createElement('tr');
+    row.style.opacity = '0';
+    row.style.transform = 'translateY(20px)';
+
+    // Create cells
+    ['name', 'length', 'width', 'cells', 'power'].forEach(key => {
+        const cell = document.createElement('td');
+        cell.textContent = panel[key] ?? '';
+        cell.contentEditable = (key !== 'name' && key !== 'power');
+
+        // Add input styling for editable cells
+        if (cell.contentEditable === 'true') {
+            cell.style.cursor = 'text';
+            cell.addEventListener('focus', function() {
+                this.style.background = 'rgba(102, 126, 234, 0.05)';
+                this.style.outline = '2px solid var(--accent-color)';
+                this.style.borderRadius = '4px';
+            });
+            cell.addEventListener('blur', function() {
+                this.style.background = '';
+                this.style.outline = '';
+                this.style.borderRadius = '';
+            });
+        }
+
+        row.appendChild(cell);
+    });
+
+    // Add row selection functionality with enhanced feedback
+    row.addEventListener('click', () => {
+        // Remove previous selection
+        tbody.querySelectorAll('tr.selected').forEach(r => {
+            r.classList.remove('selected');
+        });
+
+        // Add selection with animation
+        row.classList.add('selected');
+        row.style.transform = 'scale(1.01)';
+        setTimeout(() => {
+            row.style.transform = '';
+        }, 150);
+
+        console.log('Selected panel:', panel.name);
+        showMessage('info', `Selected panel: ${panel.name}`, 3000);
+    });
+
+    tbody.appendChild(row);
+
+    // Stagger animation for each row
+    setTimeout(() => {
+        row.style.transition = 'all 0.3s ease';
+        row.style.opacity = '1';
+        row.style.transform = 'translateY(0)';
+    }, index * 50 + 100);
+}
+
+// Row at the bottom of the table that fetches the next page
+function createLoadMoreRow(tbody, nextCursor, shown, total) {
+    const row = document.createElement('tr');
+    row.id = 'load-more-row';
+    const cell = document.createElement('td');
+    cell.colSpan = 5;
+    cell.textContent = `Showing ${shown} of ${total}, click to load more`;
+    cell.style.textAlign = 'center';
+    cell.style.color = 'var(--accent-color)';
+    row.appendChild(cell);
+    row.addEventListener('click', () => buildData(lastFilterData, nextCursor));
+    tbody.appendChild(row);
+}
+
+async function buildData(formData = null, cursor = null) {
     const filterButton = document.querySelector('button[onclick="filterTable()"]');
     
     try {
@@ -65,19 +139,24 @@ async function buildData(formData = null) {
         }
         
         showMessage('info', 'Loading panel data...', 0);
-        
-        let buildResponse;
+
+        // Copy the filters so the next page can reuse them
+        lastFilterData = formData;
+        const requestData = new FormData();
         if (formData) {
-            buildResponse = await fetch('/build_data', {
-                method: 'POST',
-                body: formData
-            });
-        } else {
-            buildResponse = await fetch('/build_data', {
-                method: 'POST'
-            });
+            for (const [key, value] of formData.entries()) {
+                requestData.append(key, value);
+            }
+        }
+        if (cursor !== null) {
+            requestData.append('cursor', cursor);
         }
 
+        const buildResponse = await fetch('/build_data', {
+            method: 'POST',
+            body: requestData
+        });
+
         if (!buildResponse.ok) {
             throw new Error(`HTTP error! status: ${buildResponse.status}`);
         }
@@ -85,17 +164,42 @@ async function buildData(formData = null) {
         const data = await buildResponse.json();
         console.log("Response data", data);
 
+        if (data.status !== 'success') {
+            throw new Error(data.message);
+        }
+
+        // No name matched so the server fell back to close matches, keep paging those
+        if (data.fuzzy && cursor === null) {
+            lastFilterData = requestData;
+            lastFilterData.set('fuzzy', '1');
+        }
+
         const tbody = document.querySelector('#panel-table tbody');
         if (!tbody) {
             throw new Error('Table body not found');
         }
 
+        // Loading another page, just swap the load more row for the new rows
+        if (cursor !== null) {
+            const loadMore = document.getElementById('load-more-row');
+            if (loadMore) loadMore.remove();
+
+            data.panels.forEach((panel, index) => createPanelRow(tbody, panel, index));
+            const shown = tbody.querySelectorAll('tr').length;
+            if (data.next_cursor !== null) {
+                createLoadMoreRow(tbody, data.next_cursor, shown, data.total);
+            }
+
+            showMessage('success', `Loaded ${shown} of ${data.total} panel(s)`, 3000);
+            return;
+        }
+
         // Clear existing data with animation
         tbody.style.opacity = '0.5';
         setTimeout(() => {
             tbody.innerHTML = '';
 
-            if (data.length === 0) {
+            if (data.panels.length === 0) {
                 const row = document.createElement('tr');
                 const cell = document.createElement('td');
                 cell.colSpan = 5;
@@ -106,62 +210,10 @@ async function buildData(formData = null) {
                 row.appendChild(cell);
                 tbody.appendChild(row);
             } else {
-                data.forEach((panel, index) => {
-                    const row = document.createElement('tr');
-                    row.style.opacity = '0';
-                    row.style.transform = 'translateY(20px)';
-                    
-                    // Create cells
-                    ['name', 'length', 'width', 'cells', 'power'].forEach(key => {
-                        const cell = document.createElement('td');
-                        cell.textContent = panel[key];
-                        cell.contentEditable = (key !== 'name' && key !== 'power');
-                        
-                        // Add input styling for editable cells
-                        if (cell.contentEditable === 'true') {
-                            cell.style.cursor = 'text';
-                            cell.addEventListener('focus', function() {
-                                this.style.background = 'rgba(102, 126, 234, 0.05)';
-                                this.style.outline = '2px solid var(--accent-color)';
-                                this.style.borderRadius = '4px';
-                            });
-                            cell.addEventListener('blur', function() {
-                                this.style.background = '';
-                                this.style.outline = '';
-                                this.style.borderRadius = '';
-                            });
-                        }
-                        
-                        row.appendChild(cell);
-                    });
-
-                    // Add row selection functionality with enhanced feedback
-                    row.addEventListener('click', () => {
-                        // Remove previous selection
-                        tbody.querySelectorAll('tr.selected').forEach(r => {
-                            r.classList.remove('selected');
-                        });
-                        
-                        // Add selection with animation
-                        row.classList.add('selected');
-                        row.style.transform = 'scale(1.01)';
-                        setTimeout(() => {
-                            row.style.transform = '';
-                        }, 150);
-                        
-                        console.log('Selected panel:', panel.name);
-                        showMessage('info', `Selected panel: ${panel.name}`, 3000);
-                    });
-
-                    tbody.appendChild(row);
-                    
-                    // Stagger animation for each row
-                    setTimeout(() => {
-                        row.style.transition = 'all 0.3s ease';
-                        row.style.opacity = '1';
-                        row.style.transform = 'translateY(0)';
-                    }, index * 50 + 100);
-                });
+                data.panels.forEach((panel, index) => createPanelRow(tbody, panel, index));
+                if (data.next_cursor !== null) {
+                    createLoadMoreRow(tbody, data.next_cursor, data.panels.length, data.total);
+                }
             }
 
             // Restore table opacity
@@ -170,8 +222,7 @@ async function buildData(formData = null) {
             }, 200);
         }, 200);
 
-        showMessage('success', `Loaded ${data.length} panel(s) successfully`, 3000);
-
+        showMessage('success', `Loaded ${data.panels.length} of ${data.total} panel(s) successfully${data.fuzzy ? ' (close matches)' : ''}`, 3000);
     } catch (error) {
         console.error('Failed to load data:', error);
         showMessage('error', `Failed to load data: ${error.message}`);
@@ -374,7 +425,13 @@ async function newPanel() {
             throw new Error(`HTTP error! status: ${pyResponse.status}`);
         }
 
-        const pyData = await pyResponse.json();
+        let pyData = await pyResponse.json();
+
+        // Fitting runs in the background, wait for it to finish
+        if (pyData.status === 'pending') {
+            showMessage('info', 'Fitting panel parameters...', 0);
+            pyData = await waitForFit(pyData.job_id);
+        }
 
         if (pyData.status === 'success') {
             showMessage('success', `New panel "${pyData.panelName || panelName}" created successfully!`);
@@ -417,6 +474,20 @@ async function newPanel() {
     }
 }
 
+// Polls the status of a background panel fit until it finishes
+async function waitForFit(jobId, interval = 1000) {
+    while (true) {
+        const statusResponse = await fetch(`/fit_status/${jobId}`);
+        const job = await statusResponse.json();
+
+        if (job.status === 'success' || job.status === 'error') {
+            return job;
+        }
+
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+}
+
 function clearForm() {
     const form = document.getElementById('newForm');
     const inputs = form.querySelectorAll('input, select');
@@ -369,10 +369,15 @@ async function handleMessage(data) {
             showStatus("Generating graphs...", 'info');
             return;
 
-        case 'graphs_ready':
-            console.log("Graphs ready", data.graphs);
-            displayGraphs(data.graphs, data.shadedPower, data.unshadedPower);
-            showStatus("Graphs generated successfully!", 'success');
+        case 'series_ready':
+            console.log("Series ready");
+            try {
+                await displayCharts(data.shadedPower, data.unshadedPower);
+                showStatus("Graphs generated successfully!", 'success');
+            } catch (e) {
+                console.error("Chart drawing error:", e);
+                showStatus("Graph generation failed: " + e.message, 'error');
+            }
             return;
 
         case 'graph_error':
@@ -421,8 +426,8 @@ function updateRealTimeData(data) {
     }
 }
 
-// Display generated graphs
-function displayGraphs(graphPaths, shadedPower, unshadedPower) {
+// Draw the power over time charts from /power_series
+async function displayCharts(shadedPower, unshadedPower) {
     let graphContainer = document.getElementById('graph-container');
     let graphGrid = document.getElementById('graph-grid');
     let powerInfoDiv = document.getElementById('power-info-div');
@@ -433,40 +438,11 @@ function displayGraphs(graphPaths, shadedPower, unshadedPower) {
     }
     powerInfoDiv.innerHTML = '';
     graphGrid.innerHTML = '';
-    
-    let pathToProcess = [];
-    if (Array.isArray(graphPaths)) {
-        pathToProcess = graphPaths.map((path, index) => ({ path, index}));
-    }
 
-    pathToProcess.forEach(({path, index}) => {
-        const graphDiv = document.createElement('div');
-        graphDiv.className = 'graph-item';
-
-        const img = document.createElement('img');
-        img.src = path;
-        img.alt = `Graph ${index + 1}`;
-        img.loading = 'lazy'; // Improve performance
-
-        // Handle image load errors
-        img.onerror = function() {
-            console.error(`Failed to load graph: ${path}`);
-            this.alt = `Failed to load graph ${index + 1}`;
-            this.style.backgroundColor = '#f0f0f0';
-            this.style.color = '#666';
-            this.style.padding = '20px';
-            this.style.textAlign = 'center';
-            this.style.border = '2px dashed #ccc';
-        };
-
-        // Add click handler for full-size view (optional enhancement)
-        img.addEventListener('click', function() {
-            openImageModal(path, `Graph ${index + 1}`);
-        });
+    // Show the graph container so the canvases have a layout
+    graphContainer.style.display = 'block';
 
-        graphDiv.appendChild(img);
-        graphGrid.appendChild(graphDiv);
-    });
+    await loadPowerCharts(graphGrid);
 
     //add the power info to the bottom
     powerInfoDiv.className = "grid-item";
@@ -493,9 +469,6 @@ function displayGraphs(graphPaths, shadedPower, unshadedPower) {
 
     //add it to the graph container
     graphContainer.appendChild(powerInfoDiv);
-
-    // Show the graph container
-    graphContainer.style.display = 'block';
 }
 
 // Optional: Open image in modal for full-size viewing
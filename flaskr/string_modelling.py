@@ -1,30 +1,28 @@
 from flask import Blueprint, render_template, request, session, url_for, current_app, jsonify, Response
 import os
+import re
 import json
-from PIL import Image
 from .refactored_classes import String
 from .models import PanelInfo, EnvironmentalData
 import flaskr.refactored_helper as hp
 from datetime import datetime, timedelta
 import pytz
 from zoneinfo import ZoneInfo
-import threading
-import matplotlib.pyplot as plt
 import copy
-import queue
-import psutil
 import shutil
-from memory_profiler import memory_usage
-import tracemalloc
-import cProfile, pstats, io
-import matplotlib.dates as mdates
 import uuid
+import hashlib
+import numpy as np
 
 sm = Blueprint('string_modelling', __name__)
 
-#tracemalloc.start()
+#profiling modules are only loaded when SOLAR_PROFILE=1
+_profiling = os.environ.get('SOLAR_PROFILE', '0') == '1'
+_process = None
 
-process = psutil.Process(os.getpid())
+if _profiling:
+    import tracemalloc
+    tracemalloc.start()
 
 #global variable for a string
 _instance = None
@@ -32,9 +30,6 @@ _instance = None
 @sm.route('/upload', methods=['POST'])
 def upload_file():
     try:
-        panels = PanelInfo.query.with_entities(PanelInfo.panel_name).distinct().all()
-        panel_names = [p.panel_name for p in panels]
-
         uploads_path = os.path.join(current_app.root_path, 'static/uploads')
 
         #clear previous file
@@ -62,55 +57,94 @@ def upload_file():
             "message": str(e)
         })
 
-@sm.route('/place_pixels', methods=['POST'])
-def place_pixels():
-    #create a unique id so to avoid using browser caching
-    unique_id = uuid.uuid4().hex
-    try:
-        output_dir = f'flaskr/static/outputs'
-
-        # Delete the entire directory if it exists
-        if os.path.exists(output_dir):
-            shutil.rmtree(output_dir)
+#the uploaded image as an rgb array, reloaded only when the upload changes
+_base_image = None
 
-        # Recreate the (now empty) directory
-        os.makedirs(output_dir)
+#rendered overlays are files named by their geometry key, so every worker can serve
+#them and they survive a restart
+def _overlay_path(key):
+    return os.path.join(current_app.root_path, 'static', 'tmp', 'overlays', f'{key}.png')
 
-        panels = PanelInfo.query.with_entities(PanelInfo.panel_name).distinct().all()
-        panel_names = [p.panel_name for p in panels]
+#overlay keys are sha1 hex digests, anything else can't name a file
+_overlay_key_pattern = re.compile(r'[0-9a-f]{40}')
 
-        #create a test string and pixel coords
-        global _instance
-        t_dict = hp._calculate_pixels(_instance)
-
-        #need to find the image first
-        filepath = f"./flaskr/static/uploads"
+#overlays kept on disk, every new position/rotation/upload draws another one
+_max_overlays = int(os.environ.get('SOLAR_MAX_OVERLAYS', '64'))
 
-        if os.path.exists(filepath):
-            files = sorted(os.listdir(filepath))
-            if files:
-                first_file = os.path.join(filepath, files[0])
-                output_path = os.path.join(output_dir, f"{unique_id}.png")
+#deletes the least recently used overlays over the limit, a use touches the file
+#so the modified time is the last use, other workers may be deleting at the same time
+def _prune_overlays(directory):
+    paths = []
+    for name in os.listdir(directory):
+        if name.endswith('.png'):
+            try:
+                paths.append((os.path.getmtime(os.path.join(directory, name)), name))
+            except OSError:
+                pass
 
-        #open and draw pixels 
+    for _, name in sorted(paths)[:max(len(paths) - _max_overlays, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+#returns the current upload and its array, cached per file
+def _get_base_image():
+    global _base_image
+    uploads_path = os.path.join(current_app.root_path, 'static/uploads')
+    files = sorted(os.listdir(uploads_path)) if os.path.exists(uploads_path) else []
+    if not files:
+        raise Exception('No image uploaded')
+
+    first_file = os.path.join(uploads_path, files[0])
+    image_key = (files[0], os.path.getmtime(first_file))
+
+    if _base_image is None or _base_image[0] != image_key:
+        from PIL import Image
         with Image.open(first_file) as img:
             #ensure in rgb
-            img = img.convert("RGB")
-            
-            #gets the pixel location 
-            for key in t_dict:
-                x,y = hp._key_to_pixel(key)
-                x = int(x)
-                y = int(y)
-                if 0 <= x < img.width and 0 <= y < img.height:
-                    img.putpixel((x, y), (0, 0, 255))
-                
-            img.save(output_path)
-            print(f'/static/outputs/{unique_id}.png')
+            _base_image = (image_key, np.asarray(img.convert("RGB")))
+
+    return _base_image
+
+#key for an overlay, the same image and string layout always draw the same pixels
+def _overlay_key(image_key, string):
+    layout = [len(module.cell_list) for panel in string.panel_list for module in panel.module_list]
+    geometry = (image_key, tuple(string.left_top_point), string.cell_width, string.cell_height,
+        string.rotation, tuple(layout))
+    return hashlib.sha1(repr(geometry).encode()).hexdigest()
+
+@sm.route('/place_pixels', methods=['POST'])
+def place_pixels():
+    try:
+        global _instance
+        if _instance is None:
+            raise Exception('No string has been built')
+
+        image_key, base = _get_base_image()
+        key = _overlay_key(image_key, _instance)
+
+        #only draw layouts that haven't been seen
+        path = _overlay_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            #create the pixel coords and draw them all at once
+            t_dict = hp._calculate_pixels(_instance)
+            xs, ys = hp._pixel_coords(t_dict)
+            png = hp._draw_overlay(base, xs, ys)
+
+            #written then renamed so a half written file is never served
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+            _prune_overlays(os.path.dirname(path))
 
         return jsonify({
             "status": "success",
-            "image": f"/static/outputs/{unique_id}.png",  # relative path for web use
+            "image": url_for('string_modelling.overlay', key=key),
         })
 
     except Exception as e:
@@ -119,6 +153,27 @@ def place_pixels():
             "status": "error",
             "message": str(e)
         })
+
+#serves a rendered overlay, the key is derived from the geometry so it can be cached for good
+@sm.route('/overlay/<key>.png', methods=['GET'])
+def overlay(key):
+    if request.if_none_match.contains(key):
+        return Response(status=304)
+
+    if not _overlay_key_pattern.fullmatch(key):
+        return jsonify({"status": "error", "message": "Unknown overlay"}), 404
+    try:
+        with open(_overlay_path(key), 'rb') as f:
+            png = f.read()
+    except OSError:
+        return jsonify({"status": "error", "message": "Unknown overlay"}), 404
+
+    response = Response(png, mimetype='image/png')
+    response.set_etag(key)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
         
 @sm.route('/build_string', methods=['POST'])
 def build_string():
@@ -342,59 +397,24 @@ def generate(_instance, timestep, p_filename, start_date, end_date,
 
                 time_module.sleep(0.7)
 
-        #queue to allow graph paths from thread
-        graph_queue = queue.Queue()
-
-        def _draw():
-            try:
-                graph_paths, shaded, unshaded = draw_graph(start_date, end_date, lat, 
-                    lon, local_instance.panel_name, timestep)
-
-                if graph_paths is None:
-                    raise Exception("No graphs formed")
-                
-                graph_queue.put({'success': True, 'paths': graph_paths, 
-                    'shadedPower': shaded, 'unshadedPower': unshaded})
-
-            except Exception as e:
-                print(f'Graph drawing failed: {e}')
-                graph_queue.put({'success': False, 'error': str(e)})
-
-        #assign the graph drawing to the background
-        graph_thread = threading.Thread(target=_draw)
-        graph_thread.start()
-
-        #indicate graphs starting
-        yield f"data: {json.dumps({'type': 'graph_generating', 'message': 'Generating graphs...'})}\n\n"
-
-        #set a timeout to avoid infinite graph
-        graph_thread.join(timeout=60)
-
-        #get results from graph and send
+        #the browser charts the series itself from /power_series
         try:
-            result = graph_queue.get_nowait()
-            
-            if result['success']:
-                graph_data = {
-                    'type': 'graphs_ready',
-                    'graphs': result['paths'],
-                    'shadedPower': result['shadedPower'],
-                    'unshadedPower': result['unshadedPower'],
-                }
-                yield f"data: {json.dumps(graph_data)}\n\n"
-            else:
-                # Send error message
-                error_data = {
-                    'type': 'graph_error',
-                    'error': result['error']
-                }
-                yield f"data: {json.dumps(error_data)}\n\n"
-
-        #if the thread times out
-        except queue.Empty:
+            _, shaded, unshaded = _read_power_logs()
+            shaded_output = hp._round_sf(hp._khw_output(timestep, shaded['power']))
+            unshaded_output = hp._round_sf(hp._khw_output(timestep, unshaded['power']))
+
+            series_data = {
+                'type': 'series_ready',
+                'shadedPower': shaded_output,
+                'unshadedPower': unshaded_output,
+            }
+            yield f"data: {json.dumps(series_data)}\n\n"
+
+        except Exception as e:
+            print(f'Reading series failed: {e}')
             error_data = {
                 'type': 'graph_error',
-                'error': 'Graph generation timed out'
+                'error': str(e)
             }
             yield f"data: {json.dumps(error_data)}\n\n"
 
@@ -432,40 +452,71 @@ def update_power():
 
     return jsonify({"status": "success", "new_power": new_power})
 
-#draws graphs of over time
-def draw_graph(start_date, end_date, lat, lon, panel_name, timestep):
-    results = [[],[],[]]
-    times = []
-    
-    u_results = [[],[],[]]
+#serves the shaded/unshaded power, voltage and current over time for the browser to chart
+#points downsamples long runs (lttb on the shaded power), format=binary returns float32 arrays
+@sm.route("/power_series", methods=['GET'])
+def power_series():
+    try:
+        points = request.args.get("points", None)
+        fmt = request.args.get("format", "json")
+
+        times, shaded, unshaded = _read_power_logs()
+        steps = list(range(min(len(times), len(unshaded['power']))))
+
+        indices = hp._lttb_indices(steps, shaded['power'], int(points) if points else None)
 
-    #sets up the results
-    with open("output_text.log", "r") as f:
-        lines = f.readlines()
-        for line in lines:
-            result = line.strip()
+        series = {'step': [steps[i] for i in indices]}
+        for key in ('power', 'voltage', 'current'):
+            series[f'shaded_{key}'] = [shaded[key][i] for i in indices]
+            series[f'unshaded_{key}'] = [unshaded[key][i] for i in indices]
 
-            #splits the results
-            divided_res = result.split('|')
+        if fmt == 'binary':
+            body, names, length = hp._series_to_bytes(series)
+            return Response(body, mimetype='application/octet-stream', headers={
+                'X-Series-Names': ','.join(names),
+                'X-Series-Length': str(length)
+            })
+
+        return jsonify({"status": "success", "time": [times[i] for i in indices], **series})
+
+    except Exception as e:
+        print(f"Failed due to {e}")
+        return jsonify({"status": "error", "message": str(e)})
+
+#reads the shaded/unshaded output logs written while modelling
+#returns the time strings and a dict of power/voltage/current lists for each
+def _read_power_logs():
+    times = []
+    shaded = {'power': [], 'voltage': [], 'current': []}
+    unshaded = {'power': [], 'voltage': [], 'current': []}
+
+    for path, results in (("output_text.log", shaded), ("unshaded_output.log", unshaded)):
+        with open(path, "r") as f:
+            for line in f:
+                #splits the results
+                divided_res = line.strip().split('|')
+                if len(divided_res) < 4:
+                    continue
+
+                if results is shaded:
+                    times.append(divided_res[0])
 
-            #place them in the correct part of the results
-            times.append(divided_res[0])
-            results[0].append(float(divided_res[1]))
-            results[1].append(float(divided_res[2]))
-            results[2].append(float(divided_res[3]))
+                #place them in the correct part of the results
+                results['power'].append(float(divided_res[1]))
+                results['voltage'].append(float(divided_res[2]))
+                results['current'].append(float(divided_res[3]))
 
-    #sets up the results
-    with open("unshaded_output.log", "r") as f:
-        lines = f.readlines()
-        for line in lines:
-            result = line.strip()
+    return times, shaded, unshaded
 
-            #splits the results
-            divided_res = result.split('|')
+#draws graphs of over time
+def draw_graph(start_date, end_date, lat, lon, panel_name, timestep):
+    #plotting is only needed offline so matplotlib is loaded here
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
 
-            u_results[0].append(float(divided_res[1]))
-            u_results[1].append(float(divided_res[2]))
-            u_results[2].append(float(divided_res[3]))
+    times, shaded, unshaded = _read_power_logs()
+    results = [shaded['power'], shaded['voltage'], shaded['current']]
+    u_results = [unshaded['power'], unshaded['voltage'], unshaded['current']]
 
     safe_start_date = start_date.strftime("%Y-%m-%d_%H-%M-%S")
     safe_end_date = end_date.strftime("%Y-%m-%d_%H-%M-%S")
@@ -554,15 +605,21 @@ def draw_graph(start_date, end_date, lat, lon, panel_name, timestep):
     
     return plot_paths, shaded_output, unshaded_output
 
-# Print memory and CPU usage
+# Print memory and CPU usage, does nothing unless profiling is enabled
 def print_resource_usage(tag=""):
-    mem_mb = process.memory_info().rss / 1024 / 1024
-    cpu_percent = process.cpu_percent(interval=0.1)
+    global _process
+    if not _profiling:
+        return
+
+    import psutil
+    if _process is None:
+        _process = psutil.Process(os.getpid())
+
+    mem_mb = _process.memory_info().rss / 1024 / 1024
+    cpu_percent = _process.cpu_percent(interval=0.1)
     with open("resource_usage.log", "a") as f:
         f.write(f"[{tag}] Memory: {mem_mb:.2f} MB | CPU: {cpu_percent:.1f}%\n")
 
-import numpy as np
-
 def break_zero_blocks(times, values):
     arr = np.array(values, dtype=float)
     mask = arr != 0
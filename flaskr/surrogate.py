@@ -0,0 +1,223 @@
+import os
+import re
+import sys
+import time
+import itertools
+import numpy as np
+import flaskr.param_grid as pg
+from flaskr.refactored_classes import String
+
+'''
+polynomial surrogate of String._model_power for quick year long estimates
+
+the string power is predicted as a fraction of the unshaded power of the same
+number of panels (from the parameter grid), from the irradiance/temperature of
+the shaded and unshaded cells and the shaded fraction of every module
+the fraction of fully unshaded modules and the shaded/unshaded irradiance
+ratio carry most of it, as the sweep either bypasses the shaded modules or
+runs the whole string at the shaded current
+models are trained per panel on a small string with the exact model, the held
+back samples run through pvlib instead of the grid so the error bound saved
+with the model is measured against the physics, not the interpolation
+only the shaded string is predicted, the unshaded one comes straight from the grid
+'''
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+
+#settings, can be overridden from the environment
+_model_dir = os.environ.get('SOLAR_SURROGATE_DIR',
+    os.path.join(_package_dir, '..', 'instance', 'surrogates'))
+
+_degree = 3
+_train_panels = 4
+_samples = 3000
+#share of the samples held back to measure the error
+_holdout = 0.2
+#below this the curves are too irregular to fit, the full model is cheap enough there
+_min_irr = 50
+
+#polynomial terms, as tuples of feature indexes
+_num_features = 7
+_terms = [()] + [c for d in range(1, _degree + 1)
+    for c in itertools.combinations_with_replacement(range(_num_features), d)]
+
+#panel name -> loaded model
+_models = {}
+
+def _model_path(panel_name):
+    return os.path.join(_model_dir, re.sub(r'[^\w.-]', '_', panel_name) + '.npz')
+
+#feature rows from the conditions and the per module shaded fractions, arrays of samples
+def _features(shaded_irr, shaded_temp, irr, temp, fractions):
+    fractions = np.atleast_2d(fractions)
+    ratio = np.minimum(np.asarray(shaded_irr, dtype=float) / irr, 1)
+    unshaded = np.mean(fractions == 0, axis=1)
+    base = np.column_stack([
+        np.asarray(irr, dtype=float) / 1000,
+        np.asarray(temp, dtype=float) / 100,
+        ratio,
+        np.asarray(shaded_temp, dtype=float) / 100,
+        unshaded,
+        np.maximum(unshaded, ratio),
+        np.mean(fractions, axis=1)
+    ])
+    return np.column_stack([np.prod(base[:, list(term)], axis=1) for term in _terms])
+
+'''
+@func runs the exact model on a small string at random conditions and shade patterns
+@params panel name, number of samples and the random seed
+@output feature rows and the (power, current) targets as fractions of the unshaded values
+'''
+def _training_data(panel_name, samples=_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    string = String(_train_panels, panel_name, (0, 0), 0)
+    modules = [module for panel in string.panel_list for module in panel.module_list]
+
+    rows = []
+    targets = []
+    for _ in range(samples):
+        irr = rng.uniform(_min_irr, 1100)
+        temp = rng.uniform(-10, 70)
+        shaded_irr = min(irr * rng.uniform(0.02, 1.2), pg._g_max)
+        shaded_temp = max(temp - rng.uniform(0, 20), pg._t_min)
+
+        #a share of the modules shaded, either to a common depth or at random
+        share = rng.uniform()
+        depth = rng.uniform()
+        fractions = []
+        for module in modules:
+            cells = len(module.cell_list)
+            count = 0
+            if rng.uniform() < share:
+                count = int(rng.integers(1, cells + 1)) if rng.uniform() < 0.5 else max(1, round(depth * cells))
+            for i, cell in enumerate(module.cell_list):
+                cell._set_shade(i < count)
+            fractions.append(count / cells)
+
+        Pmax, Vmp, Imp = string._model_power((shaded_irr, shaded_temp), (irr, temp), None)
+        unshaded = pg.lookup(panel_name, irr, temp)
+
+        rows.append(_features(shaded_irr, shaded_temp, irr, temp, fractions)[0])
+        targets.append([Pmax / (_train_panels * unshaded['Pmax']), Imp / unshaded['Isc']])
+
+    return np.array(rows), np.array(targets)
+
+'''
+@func trains and saves the surrogate of a panel, needs an app context
+@params panel name and number of samples
+@output the model dictionary (weights and the measured error bound)
+'''
+def train(panel_name, samples=_samples):
+    start = time.perf_counter()
+    split = int(samples * (1 - _holdout))
+    rows, targets = _training_data(panel_name, split)
+
+    #the grid is switched off for the held back samples so they take the pvlib fallback
+    enabled, pg._enabled = pg._enabled, False
+    try:
+        holdout_rows, holdout_targets = _training_data(panel_name, samples - split, seed=1)
+    finally:
+        pg._enabled = enabled
+
+    weights = np.linalg.lstsq(rows, targets, rcond=None)[0]
+    errors = np.abs(holdout_rows @ weights - holdout_targets)[:, 0]
+
+    model = {
+        'weights': weights,
+        'degree': _degree,
+        'grid': pg._volume_tag,
+        'error_p95': float(np.percentile(errors, 95)),
+        'error_max': float(np.max(errors)),
+    }
+
+    try:
+        os.makedirs(_model_dir, exist_ok=True)
+        path = _model_path(panel_name)
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, **model)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f'Failed to save surrogate for {panel_name} due to {e}')
+
+    _models[panel_name] = model
+    print(f'Trained surrogate for {panel_name} on {samples} samples in {time.perf_counter() - start:.1f}s')
+    return model
+
+'''
+@func loads the trained surrogate of a panel, models are only trained ahead of time with
+    python -m flaskr.surrogate so a run never stalls on training, models trained against
+    other grid axes are ignored as their targets went through the old interpolation
+@params panel name
+@output the model dictionary or None if the panel hasn't been trained
+'''
+def get_model(panel_name):
+    model = _models.get(panel_name)
+    if model is not None:
+        return model
+
+    try:
+        with np.load(_model_path(panel_name)) as data:
+            if int(data['degree']) == _degree and 'grid' in data.files and str(data['grid']) == pg._volume_tag:
+                model = {key: data[key] for key in data.files}
+                model['error_p95'] = float(model['error_p95'])
+                model['error_max'] = float(model['error_max'])
+                model['grid'] = str(model['grid'])
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f'Failed to read surrogate for {panel_name} due to {e}')
+
+    if model is None:
+        return None
+
+    _models[panel_name] = model
+    return model
+
+#drops a panel's surrogate after its parameters change
+def invalidate(panel_name):
+    _models.pop(panel_name, None)
+    try:
+        os.remove(_model_path(panel_name))
+    except FileNotFoundError:
+        pass
+
+#the error bound as text for the logs
+def describe_error(model):
+    return (f"Pmax within {model['error_p95'] * 100:.1f}% of the unshaded string power for 95% "
+        f"of validation points, worst {model['error_max'] * 100:.1f}%")
+
+'''
+@func predicts the string max power like String._model_power
+@params model, panel name, (irr, temp) of the shaded and unshaded cells, the shaded fraction
+    of every module, the number of panels and the voltage offset
+@output Pmax, Vmp, Imp or None if the conditions are off the parameter grid or too dark
+'''
+def predict(model, panel_name, shaded, unshaded, fractions, num_panels, voltage_offset=None):
+    shaded_irr, shaded_temp = shaded
+    irr, temp = unshaded
+    values = pg.lookup(panel_name, irr, temp)
+    if values is None or irr < _min_irr:
+        return None
+
+    power_share, current_share = (_features(shaded_irr, shaded_temp, irr, temp, fractions) @ model['weights'])[0]
+
+    Pmax = max(float(power_share), 0) * num_panels * values['Pmax']
+    Imp = max(float(current_share), 0) * values['Isc']
+    Vmp = Pmax / Imp if Imp > 0 else 0
+
+    if voltage_offset is not None:
+        Pmax *= voltage_offset
+        Vmp *= voltage_offset
+    return Pmax, Vmp, Imp
+
+#trains the surrogates ahead of time
+#python -m flaskr.surrogate <panel name> [<panel name> ...]
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m flaskr.surrogate <panel name> [<panel name> ...]")
+    else:
+        from flaskr import create_app
+        app = create_app()
+        with app.app_context():
+            for panel_name in sys.argv[1:]:
+                print(describe_error(train(panel_name)))
@@ -0,0 +1,138 @@
+import pandas as pd
+from datetime import datetime, timedelta
+from .models import WeatherData
+from . import db
+
+#pvgis columns kept in the store
+_columns = ['poa_direct', 'poa_sky_diffuse', 'poa_ground_diffuse',
+    'solar_elevation', 'temp_air', 'wind_speed']
+
+#sites are rounded so nearby requests share one import
+def _site(lat, lon):
+    return round(float(lat), 2), round(float(lon), 2)
+
+#naive utc datetimes, as stored in the table
+def _to_utc_naive(times):
+    times = pd.DatetimeIndex(pd.to_datetime(times))
+    if times.tz is None:
+        return times
+    return times.tz_convert('UTC').tz_localize(None)
+
+'''
+@func bulk imports hourly pvgis data for a site into the weather store, skipping
+    hours already stored, either from a downloaded pvgis file or the pvgis api
+@params lat/lon, a pvgis csv/json file path or dataframe (optional) and the years to fetch
+@output the number of rows added
+'''
+def import_pvgis(lat, lon, source=None, start_year=2021, end_year=2021):
+    import pvlib
+
+    lat, lon = _site(lat, lon)
+
+    if source is None:
+        data, metadata = pvlib.iotools.get_pvgis_hourly(
+            latitude=lat,
+            longitude=lon,
+            start=start_year,
+            end=end_year
+        )
+    elif isinstance(source, pd.DataFrame):
+        data = source
+    else:
+        data, metadata = pvlib.iotools.read_pvgis_hourly(source)
+
+    data = data.copy()
+    data.index = _to_utc_naive(data.index)
+    data = data[~data.index.duplicated(keep='first')]
+
+    #one range query for what is already there
+    existing = {
+        row.time for row in WeatherData.query.with_entities(WeatherData.time).filter(
+            WeatherData.latitude == lat,
+            WeatherData.longitude == lon,
+            WeatherData.time.between(data.index.min().to_pydatetime(), data.index.max().to_pydatetime())
+        )
+    }
+
+    columns = [c for c in _columns if c in data.columns]
+    rows = []
+    for time, values in zip(data.index, data[columns].itertuples(index=False)):
+        time = time.to_pydatetime()
+        if time in existing:
+            continue
+        row = {'latitude': lat, 'longitude': lon, 'time': time}
+        row.update({c: (None if pd.isna(v) else float(v)) for c, v in zip(columns, values)})
+        rows.append(row)
+
+    if rows:
+        db.session.bulk_insert_mappings(WeatherData, rows)
+        db.session.commit()
+
+    print(f'Imported {len(rows)} hours of pvgis weather for {lat}, {lon}')
+    return len(rows)
+
+'''
+@func reads a time range of stored weather for a site, needs an app context
+@params lat/lon and the start/end datetimes (naive are taken as utc)
+@output dataframe of the pvgis columns indexed by utc time, empty if nothing is stored
+'''
+def load_range(lat, lon, start, end):
+    lat, lon = _site(lat, lon)
+    start = _to_utc_naive([start])[0].to_pydatetime()
+    end = _to_utc_naive([end])[0].to_pydatetime()
+
+    rows = WeatherData.query.with_entities(WeatherData.time, *[getattr(WeatherData, c) for c in _columns]).filter(
+        WeatherData.latitude == lat,
+        WeatherData.longitude == lon,
+        WeatherData.time.between(start, end)
+    ).order_by(WeatherData.time).all()
+
+    df = pd.DataFrame(rows, columns=['time'] + _columns)
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('time')), name='time').tz_localize('UTC')
+    return df
+
+#years of a range with nothing stored for the site, years are always imported whole
+def _missing_years(lat, lon, start, end):
+    lat, lon = _site(lat, lon)
+    start = _to_utc_naive([start])[0].to_pydatetime()
+    end = _to_utc_naive([end])[0].to_pydatetime()
+
+    missing = []
+    for year in range(start.year, end.year + 1):
+        year_start = max(start, datetime(year, 1, 1))
+        year_end = min(end, datetime(year + 1, 1, 1) - timedelta(microseconds=1))
+        stored = WeatherData.query.with_entities(WeatherData.id).filter(
+            WeatherData.latitude == lat,
+            WeatherData.longitude == lon,
+            WeatherData.time.between(year_start, year_end)
+        ).first()
+        if stored is None:
+            missing.append(year)
+    return missing
+
+'''
+@func reads a range from the store, importing any year of it not stored yet from pvgis first
+    so a range running into a new year doesn't come back with a gap
+@params lat/lon and the start/end datetimes
+@output dataframe of the pvgis columns indexed by utc time
+'''
+def get_hourly(lat, lon, start, end):
+    for year in _missing_years(lat, lon, start, end):
+        try:
+            import_pvgis(lat, lon, start_year=year, end_year=year)
+        except Exception as e:
+            print(f'Failed to import {year} pvgis weather for {lat}, {lon} due to {e}')
+
+    return load_range(lat, lon, start, end)
+
+#imports a downloaded pvgis file for offline use
+#python -m flaskr.weather_store <lat> <lon> <pvgis file>
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 4:
+        print("Usage: python -m flaskr.weather_store <lat> <lon> <pvgis file>")
+    else:
+        from flaskr import create_app
+        app = create_app()
+        with app.app_context():
+            import_pvgis(float(sys.argv[1]), float(sys.argv[2]), sys.argv[3])
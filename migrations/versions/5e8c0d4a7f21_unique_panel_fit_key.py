@@ -0,0 +1,31 @@
+"""Unique panel fit key
+
+Revision ID: 5e8c0d4a7f21
+Revises: 9d41c7b2e8f3
+Create Date: 2026-10-19 14:26:08.913402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8c0d4a7f21'
+down_revision = '9d41c7b2e8f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # concurrent fits could have stored a datasheet twice, keep the first row of each
+    op.execute('DELETE FROM panel_fit WHERE id NOT IN (SELECT MIN(id) FROM panel_fit GROUP BY fit_key)')
+
+    with op.batch_alter_table('panel_fit', schema=None) as batch_op:
+        batch_op.drop_index('panel_fit_lookup')
+        batch_op.create_index('panel_fit_lookup', ['fit_key'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('panel_fit', schema=None) as batch_op:
+        batch_op.drop_index('panel_fit_lookup')
+        batch_op.create_index('panel_fit_lookup', ['fit_key'], unique=False)